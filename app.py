@@ -1,30 +1,116 @@
 from dotenv import load_dotenv
 # Load .env file
 load_dotenv()
-from services.graph_runner import graph_runner
-from flask import Flask, render_template, request, session, redirect, url_for, g
-import re
+from services.graph_runner import StaleTurn, graph_runner
+from graph.graph_builder import get_graph
+from services.async_runtime import run_async
+from services.image_jobs import submit_image_job, get_image_job
+from services.speculation import SPECULATIVE_MODE, start_speculation, take_speculation, record_click_latency, forget_session, speculation_stats
+from services.session_registry import SessionRegistry
+from services.turn_scheduler import TurnBusy, get_turn_scheduler
+from graph.checkpointer import checkpoint_age, checkpoint_bytes
+from langgraph.checkpoint.memory import MemorySaver
+from flask import Flask, render_template, request, session, redirect, url_for, g, jsonify, Response, stream_with_context, send_from_directory
+import json
 from utils.LLMJourneyState import LLMJourneyState
 from utils.APIJourneyUtils import APIJourneyUtils
+from utils.StreamingReplyParser import StreamingReplyParser
+from utils.ImageCacheUtils import ImageCacheUtils, get_image_cache
+from utils.ImageProviderRegistry import get_image_providers
+from utils.Metrics import SLOW_TURN_SECONDS, get_metrics, render_gauges, start_trace, stop_trace
+from graph.llm import get_llm_cache, llm_gateway, tier_stats
+import math
+import os
+import time
 import uuid
+from contextlib import ExitStack
+
+# Async serving mode: graph turns and image calls run as coroutines on a
+# shared event loop instead of blocking the request thread on each call
+ASYNC_MODE = os.getenv("ASYNC_MODE", "0") == "1"
+# Streaming mode: the journey page receives story tokens over Server-Sent Events
+STREAMING_MODE = os.getenv("STREAMING_MODE", "0") == "1"
 
 app = Flask(__name__)
-app.secret_key = "mysecretkey"
-graph_store = {}
-api_store = {}
+# Signs the session cookie; every worker must share the same key
+# (an empty value counts as unset)
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or "mysecretkey"
+
+
+def release_game(game_id, runner, idle):
+    """
+    Eviction callback for graph_store: drops the game's image API factory,
+    its speculative branches and its checkpointer thread. A durable
+    checkpointer keeps the thread unless the game has been idle past the TTL,
+    so a game can still be resumed after an LRU eviction or by another worker.
+    Idleness is judged by the game's latest checkpoint, because the game may
+    have moved on to another worker since this one last served it.
+    """
+
+    api_store.pop(game_id)
+    forget_session(runner)
+    checkpointer = runner.graph.checkpointer
+    if isinstance(checkpointer, MemorySaver):
+        checkpointer.delete_thread(game_id)
+    elif idle:
+        latest = checkpointer.get_tuple({"configurable": {"thread_id": game_id}})
+        if latest is None or checkpoint_age(latest.checkpoint) >= graph_store.ttl:
+            checkpointer.delete_thread(game_id)
+
+
+# Bounded per-game stores: idle games are swept after SESSION_TTL_SECONDS and
+# the least recently used game is evicted beyond SESSION_MAX_ENTRIES
+graph_store = SessionRegistry(graph_runner, on_evict=release_game)
+api_store = SessionRegistry(lambda game_id: APIJourneyUtils(), ttl=float("inf"))
+
+# Endpoints served without a per-game graph/API handle
+STATELESS_ENDPOINTS = {"static", "metrics", "session_stats", "image_cache_stats", "image_status", "cached_image"}
 
 
 def ensure_session():
     """
     Ensures required session keys exist for a new or returning user.
-    Initializes per-session UI state such as button messages and
+    Initializes per-session UI state such as the turn number and
     selected image generation model when missing.
     """
 
     if 'game_id' not in session:
-        session['button_messages'] = {}
+        session['turn'] = 0
         session['image_gen'] = None  # optional default
 
+@app.before_request
+def start_request_trace():
+    """
+    Starts timing the request and collecting its hot-path spans.
+    """
+
+    g.request_started = time.perf_counter()
+    g.spans = start_trace()
+
+@app.teardown_request
+def finish_request_trace(exc=None):
+    """
+    Records the request duration and, for requests slower than
+    SLOW_TURN_SECONDS, logs a per-span breakdown. Streamed responses are
+    torn down once their stream has finished.
+    """
+
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stop_trace()
+    get_metrics().observe(f"request.{request.endpoint}", elapsed)
+    if SLOW_TURN_SECONDS and elapsed > SLOW_TURN_SECONDS:
+        breakdown = {}
+        for name, seconds in g.spans:
+            total, count = breakdown.get(name, (0.0, 0))
+            breakdown[name] = (total + seconds, count + 1)
+        app.logger.warning(
+            "slow request %s %.3fs %s", request.path, elapsed,
+            {name: f"{total:.3f}s x{count}" for name, (total, count) in breakdown.items()},
+        )
+
 @app.before_request
 def load_per_request_objects():
     """
@@ -33,40 +119,60 @@ def load_per_request_objects():
     and attaches them to Flask's `g` object for request-scoped access.
     """
 
+    # Monitoring and asset endpoints never start a game
+    if request.endpoint in STATELESS_ENDPOINTS:
+        return
+
     game_id = session.get("game_id")
 
     if not game_id:
         game_id = str(uuid.uuid4())
         session["game_id"] = game_id
 
-    # graph: create once per game_id
-    if game_id not in graph_store:
-        graph_store[game_id] = graph_runner(game_id)
+    # graph and API: created once per game_id, evicted when idle
+    # (api_store entries are released together with their graph_store entry)
+    g.graph = graph_store.get(game_id)
+    g.api = api_store.get(game_id)
 
-    if game_id not in api_store:
-        api_store[game_id] = APIJourneyUtils()
 
-    # attach to g for convenience
-    g.graph = graph_store[game_id]
-    g.api = api_store[game_id]
+def session_gauges() -> dict:
+    """
+    Returns the live-session and eviction gauges of graph_store and the
+    checkpoint bytes retained by the live games.
+    """
 
+    stats = graph_store.stats()
+    sizes = checkpoint_bytes(get_graph().checkpointer)
+    stats["bytes_retained"] = sum(sizes.get(game_id, 0) for game_id in graph_store.keys())
+    return stats
 
-def process_reply(state: LLMJourneyState, reply_content: str):
+
+def process_reply(state: LLMJourneyState, result: dict):
     """
-    Parses the LLM reply into narrative text and selectable options.
-    Updates the journey state with new button messages and resets
-    button interaction state for the next turn.
+    Applies a turn result (narrative text and the options parsed by the
+    graph) to the journey state: new button messages, with button
+    interaction state reset for the next turn. Returns the narrative text.
     """
 
-    text = reply_content.split("Option 1")[0]
-    raw_options = re.findall(r"Option \d:.*", reply_content)[:3]
-    # Remove 'Option N: ' prefix from each option string
-    options = [re.sub(r"Option \d:\s*", "", opt) for opt in raw_options]
-    
     state.reset_message_states()
-    state.setup_button_messages(options)
+    state.setup_button_messages(result['options'])
     state.reset_button_states()
-    return text
+    return result['last_message']
+
+def render(template: str, **context) -> str:
+    """
+    render_template, timed as a span.
+    """
+
+    with get_metrics().span("render_template"):
+        return render_template(template, **context)
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    Formats one Server-Sent Events message.
+    """
+
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.route('/')
 def home():
@@ -83,8 +189,9 @@ def home():
 def journey():
     """
     Main game loop endpoint that advances the LLM-driven journey.
-    Handles user choices, executes a graph turn, generates optional
-    images, and renders the updated story and available actions.
+    Handles user choices, executes a graph turn, starts optional image
+    generation in the background as soon as the narrative has streamed,
+    and renders the updated story and available actions.
     """
 
     title = "LLM Journey"
@@ -97,10 +204,28 @@ def journey():
     if image_gen:
         g.api.setup_ImageGen_connection(image_gen)
 
+    if STREAMING_MODE and request.method == 'GET':
+        # Render the page shell; the story streams in from /journey/stream
+        return render(
+            'journey.html',
+            title=title,
+            text="",
+            stream_url=url_for('journey_stream'),
+            button_messages={},
+            button_states={},
+            dropdown1='gpt-4-mini',
+            dropdown2=image_gen,
+            ending=False
+        )
+
+    # The cookie only carries the turn number; the options offered after
+    # that turn come from the game handle's cache or the checkpoint
+    turn = session.get('turn', 0)
     state = LLMJourneyState()
-    state.set_button_messages(session.get('button_messages', {}))
 
+    chosen_text = None
     if request.method == 'POST':
+        state.setup_button_messages(g.graph.options_for_turn(turn))
         button_name = request.form.get('button_name')
         if not button_name or button_name not in state.get_all_button_messages():
             return redirect(url_for('home'))
@@ -108,21 +233,46 @@ def journey():
         # send the option text, not the button id
         chosen_text = state.get_button_message(button_name)
 
-        result = g.graph.run_graph_turn(user_input=chosen_text)
-        text = process_reply(state, result['last_message'])
-    else:
-        result = g.graph.run_graph_turn()
-        text = process_reply(state, result['last_message'])
+    # Image generation overlaps with the rest of the LLM reply (the options)
+    image_job = None
+    api = g.api
+
+    def start_image_job(narrative):
+        nonlocal image_job
+        image_job = submit_image_job(api, image_gen, narrative, use_async=ASYNC_MODE)
+
+    started = time.perf_counter()
+    # Turns of one game run one at a time, and a repeated submission of the
+    # turn just played (double submit, second tab) gets that turn's result
+    with g.graph.turn_slot(turn) as result:
+        played = result is not None
+        if not played and SPECULATIVE_MODE and chosen_text is not None:
+            # A pre-generated branch for this choice only needs to be committed
+            result = take_speculation(g.graph, chosen_text)
+
+        on_narrative = start_image_job if image_gen else None
+        if result is None and ASYNC_MODE:
+            result = run_async(g.graph.arun_graph_turn(user_input=chosen_text, on_narrative=on_narrative))
+        elif result is None:
+            result = g.graph.run_graph_turn(user_input=chosen_text, on_narrative=on_narrative)
+        g.graph.remember_turn(turn, result)
+    text = process_reply(state, result)
+    session['turn'] = turn + 1
+
+    if image_gen and image_job is None:
+        start_image_job(text)
 
-    image_url = g.api.get_img(image_gen, text) if image_gen else None
-    session['button_messages'] = state.get_all_button_messages()
+    if SPECULATIVE_MODE and not played:
+        start_speculation(g.graph, list(state.get_all_button_messages().values()))
+        if chosen_text is not None:
+            record_click_latency(time.perf_counter() - started)
 
     ending = not bool(state.get_all_button_messages())
-    return render_template(
+    return render(
         'journey.html',
         title=title,
         text=text,
-        image_url=image_url,
+        image_job=image_job,
         button_messages=state.get_all_button_messages(),
         button_states=state.get_all_button_states(),
         dropdown1='gpt-4-mini',
@@ -130,6 +280,242 @@ def journey():
         ending=ending
     )
 
+@app.route('/journey/stream', methods=['POST'])
+def journey_stream():
+    """
+    Streams one game turn to the browser as Server-Sent Events.
+    Emits story tokens as they arrive, each option once its line is complete,
+    the background image job, and a final event with per-turn timings
+    (time-to-first-token and time-to-options). A failed turn ends the stream
+    with an "error" event.
+
+    Only a POST advances the game: the chosen option's button_name plays the
+    next turn, and a request without one starts the game, or shows the
+    latest turn again once the game has started (e.g. after a page reload).
+    """
+
+    image_gen = session.get('image_gen')
+    if image_gen:
+        g.api.setup_ImageGen_connection(image_gen)
+
+    chosen_text = None
+    turn = session.get('turn', 0)
+    button_name = request.form.get('button_name')
+    if button_name:
+        state = LLMJourneyState()
+        state.setup_button_messages(g.graph.options_for_turn(turn))
+        chosen_text = state.get_button_message(button_name)
+        if chosen_text is None:
+            return jsonify({"error": "unknown option"}), 400
+    redisplay = button_name is None and turn > 0
+
+    api, graph = g.api, g.graph
+    # The turn slot is taken before the response starts, so a busy server
+    # answers 429 at once, and it is held until the turn's result is in.
+    # A repeated submission of the turn just played replays that turn
+    turn_slot = ExitStack()
+    ready = turn_slot.enter_context(graph.turn_slot(turn - 1 if redisplay else turn))
+    played = redisplay or ready is not None
+
+    image_jobs = []
+    clicked_at = time.perf_counter()
+    try:
+        if redisplay and ready is None:
+            ready = graph.current_turn()
+        elif not played and SPECULATIVE_MODE and chosen_text is not None:
+            ready = take_speculation(graph, chosen_text)
+    except BaseException:
+        turn_slot.close()
+        raise
+
+    if not redisplay:
+        # The cookie goes out with the response headers, before the turn has
+        # run. If the turn fails, the next request misses the options cache
+        # and reads the checkpoint instead
+        session['turn'] = turn + 1
+
+    def start_image_job(narrative):
+        image_jobs.append(submit_image_job(api, image_gen, narrative, use_async=ASYNC_MODE))
+
+    def parsed_events(parser, narrative, new_options):
+        if narrative:
+            yield sse_event("token", {"text": narrative})
+        first = len(parser.options) - len(new_options) + 1
+        for number, option in enumerate(new_options, first):
+            yield sse_event("option", {"name": f"Option {number}", "text": option})
+
+    def turn_events():
+        if ready is None:
+            yield from graph.stream_graph_turn(chosen_text, on_narrative=start_image_job if image_gen else None)
+            return
+        # Speculative hit, repeated submission or reload: the whole reply is already available
+        if ready["last_message"]:
+            if image_gen:
+                start_image_job(ready["last_message"])
+            yield "token", ready["last_message"]
+        yield "result", ready
+
+    def events():
+        started = time.perf_counter()
+        first_token_at = options_at = None
+        parser = StreamingReplyParser()
+        result = None
+
+        try:
+            for kind, payload in turn_events():
+                if kind == "result":
+                    result = payload
+                elif kind == "reset":
+                    parser = StreamingReplyParser()
+                    yield sse_event("reset", {})
+                elif kind == "token":
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield from parsed_events(parser, *parser.feed(payload))
+                    if len(parser.options) == parser.MAX_OPTIONS and options_at is None:
+                        options_at = time.perf_counter()
+                while image_jobs:
+                    yield sse_event("image", {"url": url_for('image_status', job_id=image_jobs.pop())})
+        except Exception:
+            # The headers (and the turn's cookie) are already out: report the
+            # failure in the stream instead of an HTTP status
+            app.logger.exception("turn %s failed", graph.thread_id)
+            turn_slot.close()
+            yield sse_event("error", {"error": "turn failed"})
+            return
+
+        if not redisplay:
+            graph.remember_turn(turn, result)
+        turn_slot.close()
+        yield from parsed_events(parser, *parser.finish())
+        # The options stored by the graph are authoritative, e.g. when a reply
+        # fell back to a format the stream parser could not follow
+        missing = result["options"][len(parser.options):]
+        parser.options.extend(missing)
+        yield from parsed_events(parser, "", missing)
+        if options_at is None:
+            options_at = time.perf_counter()
+
+        timings = {
+            "time_to_first_token": round((first_token_at or options_at) - started, 3),
+            "time_to_options": round(options_at - started, 3),
+        }
+        app.logger.info("turn %s %s", graph.thread_id, timings)
+        if SPECULATIVE_MODE and not played:
+            start_speculation(graph, result["options"])
+            if chosen_text is not None:
+                record_click_latency(options_at - clicked_at)
+        yield sse_event("done", {"ending": not result["options"], **timings})
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Also frees the slot when the client goes away mid-turn
+    response.call_on_close(turn_slot.close)
+    return response
+
+@app.errorhandler(TurnBusy)
+def turn_busy(exc):
+    """
+    Answers a turn that could not be admitted (turn queue full, or too many
+    requests waiting for the same game) with 429 and a Retry-After hint.
+    """
+
+    response = jsonify({"error": "busy", "retry_after": exc.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(math.ceil(exc.retry_after))
+    return response
+
+@app.errorhandler(StaleTurn)
+def stale_turn(exc):
+    """
+    Answers a choice made for a turn the game is no longer (or not yet) at,
+    e.g. from another tab, with 409. The cookie is moved to the game's turn;
+    the streaming page reports the conflict, the HTML page shows that turn.
+    """
+
+    session['turn'] = exc.current_turn
+    if request.endpoint == 'journey_stream':
+        return jsonify({"error": "stale turn", "turn": exc.current_turn}), 409
+    state = LLMJourneyState()
+    text = process_reply(state, g.graph.current_turn())
+    page = render(
+        'journey.html',
+        title="LLM Journey",
+        text=text,
+        button_messages=state.get_all_button_messages(),
+        button_states=state.get_all_button_states(),
+        dropdown1='gpt-4-mini',
+        dropdown2=session.get('image_gen'),
+        ending=not state.get_all_button_messages()
+    )
+    return page, 409
+
+@app.route("/image/<job_id>")
+def image_status(job_id):
+    """
+    Polled by the journey page to fill in the scene image placeholder.
+    Returns the background image job status and, once done, its URL and
+    the srcset of its resized variants (when the image is cached locally).
+    """
+
+    job = get_image_job(job_id)
+    if job is None:
+        return jsonify({"status": "unknown"}), 404
+    if job.get("url") and (srcset := get_image_cache().srcset(job["url"])):
+        job = {**job, "srcset": srcset}
+    return jsonify(job)
+
+@app.route(f"{ImageCacheUtils.URL_PREFIX}/<path:filename>")
+def cached_image(filename):
+    """
+    Serves generated images and their resized variants from the
+    content-addressed image cache. File names are content hashes, so
+    responses can be cached forever.
+    """
+
+    response = send_from_directory(get_image_cache().cache_dir, filename, max_age=31536000)
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/images/stats")
+def image_cache_stats():
+    """
+    Returns the image cache hit/miss/eviction counters and stored bytes.
+    """
+
+    return jsonify(get_image_cache().stats())
+
+@app.route("/sessions/stats")
+def session_stats():
+    """
+    Returns live-session and eviction gauges and the checkpoint bytes
+    retained by the live games.
+    """
+
+    return jsonify(session_gauges())
+
+@app.route("/metrics")
+def metrics():
+    """
+    Serves span histograms, token counters and the cache, speculation,
+    session and provider gauges in the Prometheus text format.
+    """
+
+    body = get_metrics().render()
+    body += render_gauges("image_cache", get_image_cache().stats())
+    if (llm_cache := get_llm_cache()) is not None:
+        body += render_gauges("llm_cache", llm_cache.stats())
+    body += render_gauges("llm_tier", tier_stats())
+    body += render_gauges("speculation", speculation_stats())
+    body += render_gauges("sessions", session_gauges())
+    body += render_gauges("turns", get_turn_scheduler().stats())
+    body += render_gauges("llm_gateway", llm_gateway.stats())
+    body += render_gauges("image_gateway", get_image_providers().stats())
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
 @app.route("/reset")
 def reset_game():
     """
@@ -141,8 +527,7 @@ def reset_game():
     game_id = session.get("game_id")
 
     if game_id:
-        graph_store.pop(game_id, None)
-        api_store.pop(game_id, None)
+        graph_store.pop(game_id)
 
     session.clear()
     return redirect(url_for("home"))
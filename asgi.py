@@ -0,0 +1,18 @@
+"""
+ASGI entry point for the async serving mode.
+
+    uvicorn asgi:asgi_app --host 0.0.0.0 --port 8000
+
+The Flask app is mounted through a2wsgi's WSGI adapter. With ASYNC_MODE
+enabled, the LLM/image calls run as coroutines on the shared event loop
+(services.async_runtime), but the views stay synchronous: every in-flight
+request still holds one of the ASGI_THREADS adapter threads while it waits.
+"""
+import os
+
+os.environ.setdefault("ASYNC_MODE", "1")
+
+from a2wsgi import WSGIMiddleware
+from app import app
+
+asgi_app = WSGIMiddleware(app, workers=int(os.getenv("ASGI_THREADS", "256")))
@@ -0,0 +1,763 @@
+import asyncio
+import hashlib
+import os
+import random
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from collections import defaultdict
+from queue import Empty, Queue
+from typing import Any, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from .config import CHECKPOINT_COMPACT_EVERY, CHECKPOINT_KEEP_LATEST, DEFAULT_CONFIG, GraphConfig
+
+# Checkpointer backend selection (see .env.example)
+CHECKPOINTER_BACKEND = os.getenv("CHECKPOINTER_BACKEND", "memory")
+CHECKPOINTER_PATH = os.getenv("CHECKPOINTER_PATH", "data/checkpoints.sqlite")
+CHECKPOINTER_POOL_SIZE = int(os.getenv("CHECKPOINTER_POOL_SIZE", "8"))
+
+# Store the messages channel as references to per-thread message blobs, so
+# each message is serialized once instead of once per checkpoint
+CHECKPOINT_DEDUP_MESSAGES = os.getenv("CHECKPOINT_DEDUP_MESSAGES", "0") == "1"
+
+# Turn leases: how long a worker may hold a game's turn before another
+# worker takes it over (e.g. after a crash), and how often waiters poll
+CHECKPOINT_LEASE_TTL = float(os.getenv("CHECKPOINT_LEASE_TTL", "300"))
+CHECKPOINT_LEASE_POLL = 0.02
+
+# Blob type of a messages channel value stored as message references
+MESSAGES_CHANNEL = "messages"
+REFS_TYPE = "msgrefs"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    message_key TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, message_key)
+);
+CREATE TABLE IF NOT EXISTS turn_leases (
+    thread_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def _check_compaction(keep_latest: int, compact_every: int):
+    # The previous checkpoint may still receive writes while the next one is
+    # stored, so at least two are always kept
+    if keep_latest == 1 or keep_latest < 0 or compact_every < 1:
+        raise ValueError(f"Invalid checkpoint compaction: keep {keep_latest}, every {compact_every}")
+
+
+def split_messages(serde, messages: list) -> tuple[bytes, dict[str, tuple[str, bytes]]]:
+    """
+    Serializes each message on its own. Returns the ordered message keys
+    (content hashes) as a msgpack blob, and the serialized message per key.
+    """
+    keys, bodies = [], {}
+    for message in messages:
+        type_, blob = serde.dumps_typed(message)
+        key = hashlib.sha256(type_.encode("utf-8") + b"\0" + blob).hexdigest()[:32]
+        keys.append(key)
+        bodies[key] = (type_, blob)
+    return serde.dumps_typed(keys)[1], bodies
+
+
+def message_keys(serde, refs: bytes) -> list[str]:
+    """
+    Returns the message keys stored in a message references blob.
+    """
+    return serde.loads_typed(("msgpack", refs))
+
+
+class SQLiteSaver(BaseCheckpointSaver[str]):
+    """
+    File-backed LangGraph checkpointer using SQLite in WAL mode.
+    Connections are drawn from a small pool so concurrent requests and
+    worker processes can share one database file, and channel values are
+    stored once per version as compact msgpack blobs via the serializer.
+    Only the latest keep_latest checkpoints of a thread are retained (0
+    keeps them all), and with dedup_messages each message is stored once
+    per thread and referenced from the messages channel blobs. Turn leases
+    (a row per game) let worker processes sharing the file run a game's
+    turns one at a time.
+    """
+
+    def __init__(
+        self,
+        path: str = CHECKPOINTER_PATH,
+        pool_size: int = CHECKPOINTER_POOL_SIZE,
+        *,
+        serde=None,
+        keep_latest: int = CHECKPOINT_KEEP_LATEST,
+        compact_every: int = CHECKPOINT_COMPACT_EVERY,
+        dedup_messages: bool = CHECKPOINT_DEDUP_MESSAGES,
+    ):
+        """
+        Opens (or creates) the checkpoint database at the given path,
+        enables WAL journaling and pre-fills the connection pool.
+        """
+        super().__init__(serde=serde)
+        _check_compaction(keep_latest, compact_every)
+        self.keep_latest = keep_latest
+        self.compact_every = compact_every
+        self.dedup_messages = dedup_messages
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.pool: Queue[sqlite3.Connection] = Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self.pool.put(self._connect())
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Creates a pooled connection tuned for many short concurrent transactions.
+        """
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrows a connection from the pool and returns it when done.
+        """
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrows a connection and runs the enclosed statements as one
+        IMMEDIATE transaction, so each batch costs a single WAL commit.
+        """
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """
+        Closes every pooled connection.
+        """
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except Empty:
+                break
+
+    def _load_blobs(self, conn, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        """
+        Loads the channel values referenced by a checkpoint's channel versions.
+        """
+        if not versions:
+            return {}
+        channel_values = {}
+        rows = conn.execute(
+            f"""SELECT channel, type, blob FROM blobs
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                AND (channel, version) IN ({",".join(["(?, ?)"] * len(versions))})""",
+            [thread_id, checkpoint_ns, *(x for kv in versions.items() for x in (kv[0], str(kv[1])))],
+        ).fetchall()
+        for channel, type_, blob in rows:
+            if type_ == REFS_TYPE:
+                channel_values[channel] = self._load_messages(conn, thread_id, checkpoint_ns, message_keys(self.serde, blob))
+            elif type_ != "empty":
+                channel_values[channel] = self.serde.loads_typed((type_, blob))
+        return channel_values
+
+    def _load_messages(self, conn, thread_id: str, checkpoint_ns: str, keys: list[str]) -> list:
+        """
+        Loads referenced messages, in reference order.
+        """
+        bodies = {}
+        for key, type_, blob in conn.execute(
+            f"""SELECT message_key, type, blob FROM messages
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                AND message_key IN ({",".join("?" * len(set(keys)))})""",
+            [thread_id, checkpoint_ns, *set(keys)],
+        ):
+            bodies[key] = self.serde.loads_typed((type_, blob))
+        return [bodies[key] for key in keys]
+
+    def _to_tuple(self, conn, thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata) -> CheckpointTuple:
+        """
+        Builds a CheckpointTuple from a checkpoints row, loading its blobs and pending writes.
+        """
+        checkpoint_: Checkpoint = self.serde.loads_typed((type_, checkpoint))
+        writes = conn.execute(
+            """SELECT task_id, channel, type, value FROM writes
+               WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+               ORDER BY task_id, idx""",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint_,
+                "channel_values": self._load_blobs(conn, thread_id, checkpoint_ns, checkpoint_["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed(("msgpack", metadata)),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        """
+        Returns the requested checkpoint, or the latest one for the thread
+        when the config carries no checkpoint_id.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._connection() as conn:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = conn.execute(
+                    """SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints
+                       WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?""",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    """SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints
+                       WHERE thread_id = ? AND checkpoint_ns = ?
+                       ORDER BY checkpoint_id DESC LIMIT 1""",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._to_tuple(conn, thread_id, checkpoint_ns, *row)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        """
+        Yields checkpoints newest first, optionally restricted to a thread,
+        namespace, checkpoint id, metadata filter or `before` cursor.
+        """
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+            for row in rows:
+                if limit is not None and limit <= 0:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed(("msgpack", row[6]))
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                if limit is not None:
+                    limit -= 1
+                yield self._to_tuple(conn, *row)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """
+        Stores a checkpoint and the channel values that changed in it,
+        batching all inserts into a single transaction.
+        """
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        values: dict[str, Any] = c.pop("channel_values")
+        blob_rows, message_rows = [], []
+        for channel, version in new_versions.items():
+            if channel not in values:
+                type_, blob = "empty", None
+            elif self.dedup_messages and channel == MESSAGES_CHANNEL:
+                type_ = REFS_TYPE
+                blob, bodies = split_messages(self.serde, values[channel])
+                message_rows += [(thread_id, checkpoint_ns, key, *body) for key, body in bodies.items()]
+            else:
+                type_, blob = self.serde.dumps_typed(values[channel])
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+        type_, serialized = self.serde.dumps_typed(c)
+        _, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)", message_rows)
+            conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blob_rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    serialized,
+                    serialized_metadata,
+                ),
+            )
+            if self.keep_latest:
+                (count,) = conn.execute(
+                    "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+                if count >= self.keep_latest + self.compact_every:
+                    self._compact(conn, thread_id, checkpoint_ns)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """
+        Stores a task's intermediate writes in one batched transaction.
+        Special writes (errors, interrupts) overwrite; regular writes are idempotent.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path))
+        verb = "INSERT OR REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "INSERT OR IGNORE"
+        with self._transaction() as conn:
+            conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _compact(self, conn, thread_id: str, checkpoint_ns: str) -> int:
+        """
+        Deletes all but the latest keep_latest checkpoints of a thread, with
+        their writes and the blobs and messages no kept checkpoint references.
+        Returns the number of checkpoints deleted.
+        """
+        rows = conn.execute(
+            """SELECT checkpoint_id, type, checkpoint FROM checkpoints
+               WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC""",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        kept, stale = rows[:self.keep_latest], rows[self.keep_latest:]
+        if not stale:
+            return 0
+        # Every blob was stored with the checkpoint that first referenced it
+        kept_versions = {
+            (channel, str(version))
+            for _, type_, checkpoint in kept
+            for channel, version in self.serde.loads_typed((type_, checkpoint))["channel_versions"].items()
+        }
+        stale_versions = {
+            (channel, str(version))
+            for _, type_, checkpoint in stale
+            for channel, version in self.serde.loads_typed((type_, checkpoint))["channel_versions"].items()
+        } - kept_versions
+        conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            [(thread_id, checkpoint_ns, *version) for version in stale_versions],
+        )
+        oldest = kept[-1][0]
+        for table in ("checkpoints", "writes"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest),
+            )
+        if any(channel == MESSAGES_CHANNEL for channel, _ in stale_versions):
+            self._collect_messages(conn, thread_id, checkpoint_ns)
+        return len(stale)
+
+    def _collect_messages(self, conn, thread_id: str, checkpoint_ns: str) -> None:
+        """
+        Deletes the thread's stored messages that no messages blob references.
+        """
+        referenced = set()
+        for (refs,) in conn.execute(
+            "SELECT blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND type = ?",
+            (thread_id, checkpoint_ns, REFS_TYPE),
+        ).fetchall():
+            referenced.update(message_keys(self.serde, refs))
+        stored = conn.execute(
+            "SELECT message_key FROM messages WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        conn.executemany(
+            "DELETE FROM messages WHERE thread_id = ? AND checkpoint_ns = ? AND message_key = ?",
+            [(thread_id, checkpoint_ns, key) for (key,) in stored if key not in referenced],
+        )
+
+    def compact(self, thread_id: str) -> int:
+        """
+        Applies the keep_latest policy to a thread now (e.g. to a database
+        written before compaction was enabled). Returns the checkpoints deleted.
+        """
+        if not self.keep_latest:
+            return 0
+        deleted = 0
+        with self._transaction() as conn:
+            namespaces = conn.execute("SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchall()
+            for (checkpoint_ns,) in namespaces:
+                deleted += self._compact(conn, thread_id, checkpoint_ns)
+        return deleted
+
+    def delete_thread(self, thread_id: str) -> None:
+        """
+        Removes every checkpoint, blob, write and message stored for the thread.
+        """
+        with self._transaction() as conn:
+            for table in ("checkpoints", "blobs", "writes", "messages", "turn_leases"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def acquire_lease(self, thread_id: str, owner: str, ttl: float = CHECKPOINT_LEASE_TTL) -> bool:
+        """
+        Takes (or renews) the thread's turn lease for owner, unless another
+        owner holds an unexpired one. Returns whether owner now holds it.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT owner, expires FROM turn_leases WHERE thread_id = ?", (thread_id,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO turn_leases VALUES (?, ?, ?)", (thread_id, owner, now + ttl))
+        return True
+
+    def release_lease(self, thread_id: str, owner: str) -> None:
+        """
+        Drops the thread's turn lease if owner still holds it.
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM turn_leases WHERE thread_id = ? AND owner = ?", (thread_id, owner))
+
+    @contextmanager
+    def turn_lease(self, thread_id: str, timeout: float) -> Iterator[None]:
+        """
+        Holds the thread's turn lease for the enclosed block, waiting up to
+        timeout seconds for another worker's turn. Raises TimeoutError.
+        """
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while not self.acquire_lease(thread_id, owner):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"turn lease of {thread_id} is held by another worker")
+            time.sleep(CHECKPOINT_LEASE_POLL)
+        try:
+            yield
+        finally:
+            self.release_lease(thread_id, owner)
+
+    def get_next_version(self, current: str | None, channel: None = None) -> str:
+        """
+        Returns a monotonically increasing, zero-padded string version
+        (same scheme as MemorySaver) so versions sort correctly as TEXT.
+        """
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class CompactingMemorySaver(MemorySaver):
+    """
+    MemorySaver with the same retention options as SQLiteSaver: only the
+    latest keep_latest checkpoints of a thread are retained (0 keeps them
+    all), and with dedup_messages each message is stored once per thread.
+    """
+
+    def __init__(
+        self,
+        *,
+        serde=None,
+        keep_latest: int = CHECKPOINT_KEEP_LATEST,
+        compact_every: int = CHECKPOINT_COMPACT_EVERY,
+        dedup_messages: bool = CHECKPOINT_DEDUP_MESSAGES,
+    ):
+        super().__init__(serde=serde)
+        _check_compaction(keep_latest, compact_every)
+        self.keep_latest = keep_latest
+        self.compact_every = compact_every
+        self.dedup_messages = dedup_messages
+        # (thread_id, checkpoint_ns) -> {message key: serialized message}
+        self.messages: defaultdict[tuple[str, str], dict[str, tuple[str, bytes]]] = defaultdict(dict)
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        channel_values: dict[str, Any] = {}
+        for channel, version in versions.items():
+            type_, blob = self.blobs.get((thread_id, checkpoint_ns, channel, version), ("empty", b""))
+            if type_ == REFS_TYPE:
+                bodies = self.messages[(thread_id, checkpoint_ns)]
+                channel_values[channel] = [self.serde.loads_typed(bodies[key]) for key in message_keys(self.serde, blob)]
+            elif type_ != "empty":
+                channel_values[channel] = self.serde.loads_typed((type_, blob))
+        return channel_values
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """
+        Stores a checkpoint like MemorySaver.put, then compacts the thread
+        once it holds compact_every checkpoints more than keep_latest.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        values = checkpoint["channel_values"]
+        if self.dedup_messages and MESSAGES_CHANNEL in new_versions and MESSAGES_CHANNEL in values:
+            refs, bodies = split_messages(self.serde, values[MESSAGES_CHANNEL])
+            self.messages[(thread_id, checkpoint_ns)].update(bodies)
+            # MemorySaver.put serializes the other channels; the messages blob
+            # is written before the checkpoint that references it
+            self.blobs[(thread_id, checkpoint_ns, MESSAGES_CHANNEL, new_versions[MESSAGES_CHANNEL])] = (REFS_TYPE, refs)
+            checkpoint = {**checkpoint, "channel_values": {k: v for k, v in values.items() if k != MESSAGES_CHANNEL}}
+            new_versions = {k: v for k, v in new_versions.items() if k != MESSAGES_CHANNEL}
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        if self.keep_latest and len(self.storage[thread_id][checkpoint_ns]) >= self.keep_latest + self.compact_every:
+            self._compact(thread_id, checkpoint_ns)
+        return next_config
+
+    def _compact(self, thread_id: str, checkpoint_ns: str) -> int:
+        """
+        Deletes all but the latest keep_latest checkpoints of a thread, with
+        their writes and the blobs and messages no kept checkpoint references.
+        Returns the number of checkpoints deleted.
+        """
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        ids = sorted(checkpoints, reverse=True)
+        kept, stale = ids[:self.keep_latest], ids[self.keep_latest:]
+        if not stale:
+            return 0
+        kept_versions = {
+            item for checkpoint_id in kept
+            for item in self.serde.loads_typed(checkpoints[checkpoint_id][0])["channel_versions"].items()
+        }
+        stale_versions = {
+            item for checkpoint_id in stale
+            for item in self.serde.loads_typed(checkpoints[checkpoint_id][0])["channel_versions"].items()
+        } - kept_versions
+        for checkpoint_id in stale:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        for channel, version in stale_versions:
+            self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+        if (thread_id, checkpoint_ns) in self.messages:
+            referenced = set()
+            for channel, version in kept_versions:
+                type_, blob = self.blobs.get((thread_id, checkpoint_ns, channel, version), ("empty", b""))
+                if type_ == REFS_TYPE:
+                    referenced.update(message_keys(self.serde, blob))
+            bodies = self.messages[(thread_id, checkpoint_ns)]
+            for key in [key for key in bodies if key not in referenced]:
+                del bodies[key]
+        return len(stale)
+
+    def compact(self, thread_id: str) -> int:
+        """
+        Applies the keep_latest policy to a thread now. Returns the checkpoints deleted.
+        """
+        if not self.keep_latest or thread_id not in self.storage:
+            return 0
+        return sum(self._compact(thread_id, checkpoint_ns) for checkpoint_ns in list(self.storage[thread_id]))
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        for key in [key for key in self.messages if key[0] == thread_id]:
+            del self.messages[key]
+
+
+def get_checkpointer(backend: str = CHECKPOINTER_BACKEND, graph_config: GraphConfig = DEFAULT_CONFIG) -> BaseCheckpointSaver:
+    """
+    Creates the checkpointer selected by CHECKPOINTER_BACKEND.
+    "memory" keeps state in the process heap; "sqlite" persists it to
+    CHECKPOINTER_PATH so any worker process can resume any thread_id.
+    Both retain checkpoints as set by graph_config and apply the
+    CHECKPOINT_DEDUP_MESSAGES policy.
+    """
+    retention = {
+        "keep_latest": graph_config.checkpoint_keep_latest,
+        "compact_every": graph_config.checkpoint_compact_every,
+    }
+    if backend == "memory":
+        return CompactingMemorySaver(**retention)
+    if backend == "sqlite":
+        return SQLiteSaver(CHECKPOINTER_PATH, CHECKPOINTER_POOL_SIZE, **retention)
+    raise ValueError(f"Unsupported checkpointer backend: {backend}")
+
+
+def copy_checkpoint(graph, from_thread_id: str, to_thread_id: str) -> CheckpointTuple | None:
+    """
+    Copies the latest checkpoint of one thread on top of another, so the
+    target resumes exactly where the source stopped (same channel values,
+    versions and pending next node). Returns the copied checkpoint tuple,
+    or None (copying nothing) when the source thread has no checkpoint.
+    """
+    checkpointer = graph.checkpointer
+    source = checkpointer.get_tuple({"configurable": {"thread_id": from_thread_id}})
+    if source is None:
+        return None
+    target = checkpointer.get_tuple({"configurable": {"thread_id": to_thread_id}})
+    config = {"configurable": {"thread_id": to_thread_id, "checkpoint_ns": ""}}
+    if target is not None:
+        config["configurable"]["checkpoint_id"] = target.config["configurable"]["checkpoint_id"]
+    checkpointer.put(config, source.checkpoint, source.metadata, source.checkpoint["channel_versions"])
+    return source
+
+
+def checkpoint_age(checkpoint: Checkpoint) -> float:
+    """
+    Returns how many seconds ago a checkpoint was written.
+    """
+    return (datetime.now(timezone.utc) - datetime.fromisoformat(checkpoint["ts"])).total_seconds()
+
+
+def checkpoint_bytes(checkpointer: BaseCheckpointSaver) -> dict[str, int]:
+    """
+    Returns the serialized size in bytes of everything stored per thread_id
+    (checkpoints, channel blobs, pending writes and deduplicated messages).
+    """
+    sizes: dict[str, int] = {}
+    if isinstance(checkpointer, SQLiteSaver):
+        with checkpointer._connection() as conn:
+            for query in (
+                "SELECT thread_id, SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints GROUP BY thread_id",
+                "SELECT thread_id, SUM(IFNULL(LENGTH(blob), 0)) FROM blobs GROUP BY thread_id",
+                "SELECT thread_id, SUM(IFNULL(LENGTH(value), 0)) FROM writes GROUP BY thread_id",
+                "SELECT thread_id, SUM(IFNULL(LENGTH(blob), 0)) FROM messages GROUP BY thread_id",
+            ):
+                for thread_id, size in conn.execute(query):
+                    sizes[thread_id] = sizes.get(thread_id, 0) + (size or 0)
+    elif isinstance(checkpointer, MemorySaver):
+        for thread_id, namespaces in list(checkpointer.storage.items()):
+            for checkpoints in list(namespaces.values()):
+                for checkpoint, metadata, _ in list(checkpoints.values()):
+                    sizes[thread_id] = sizes.get(thread_id, 0) + len(checkpoint[1]) + len(metadata[1])
+        for (thread_id, *_), (_, blob) in list(checkpointer.blobs.items()):
+            sizes[thread_id] = sizes.get(thread_id, 0) + len(blob)
+        for (thread_id, *_), writes in list(checkpointer.writes.items()):
+            sizes[thread_id] = sizes.get(thread_id, 0) + sum(len(value[1]) for _, _, value, _ in writes.values())
+        for (thread_id, _), bodies in list(getattr(checkpointer, "messages", {}).items()):
+            sizes[thread_id] = sizes.get(thread_id, 0) + sum(len(blob) for _, blob in list(bodies.values()))
+    else:
+        raise ValueError(f"Cannot measure checkpointer: {type(checkpointer).__name__}")
+    return sizes
@@ -0,0 +1,40 @@
+import os
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# Defaults for GraphConfig (see .env.example)
+GAME_MAX_TURNS = int(os.getenv("GAME_MAX_TURNS", "5"))
+SUMMARIZE_EVERY = int(os.getenv("SUMMARIZE_EVERY", "1"))
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "4"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Compaction: keep only the latest CHECKPOINT_KEEP_LATEST checkpoints per
+# thread (0 keeps them all), pruning whenever a thread has gathered
+# CHECKPOINT_COMPACT_EVERY more
+CHECKPOINT_KEEP_LATEST = int(os.getenv("CHECKPOINT_KEEP_LATEST", "4"))
+CHECKPOINT_COMPACT_EVERY = int(os.getenv("CHECKPOINT_COMPACT_EVERY", "4"))
+
+
+class GraphConfig(BaseModel):
+    """
+    Story length and graph behaviour, in one place. Configs are immutable and
+    hashable, so get_graph(config) compiles each distinct config only once.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    max_turns: int = Field(default=GAME_MAX_TURNS, ge=1, description="Player choices before the ending")
+    summarize_every: int = Field(default=SUMMARIZE_EVERY, ge=1, description="Turns between history budget checks")
+    history_window: int = Field(default=HISTORY_WINDOW, ge=1, description="Messages kept verbatim in prompts")
+    history_token_budget: int = Field(default=HISTORY_TOKEN_BUDGET, ge=1, description="Token budget of the history before it is summarized")
+    checkpoint_keep_latest: int = Field(default=CHECKPOINT_KEEP_LATEST, ge=0, description="Checkpoints kept per game (0 keeps all)")
+    checkpoint_compact_every: int = Field(default=CHECKPOINT_COMPACT_EVERY, ge=1, description="New checkpoints between compactions")
+
+    @field_validator("checkpoint_keep_latest")
+    @classmethod
+    def _keep_previous_checkpoint(cls, value: int) -> int:
+        # The previous checkpoint may still receive writes while the next one is stored
+        if value == 1:
+            raise ValueError("checkpoint_keep_latest must be 0 or at least 2")
+        return value
+
+
+DEFAULT_CONFIG = GraphConfig()
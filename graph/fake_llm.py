@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Fake model settings (see .env.example): median time to first token, the
+# spread of the log-normal latency distribution, and the streaming speed
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+
+PLACES = ["a misty harbor", "an abandoned observatory", "a moss-covered bridge", "a desert caravan", "a sunken library"]
+EVENTS = ["a lantern flickers out", "distant bells start ringing", "a stranger waves at you", "the ground trembles", "a door creaks open"]
+ACTIONS = ["Follow the sound", "Search the area", "Call out for help", "Turn back the way you came", "Wait and listen"]
+
+
+class FakeStoryModel(BaseChatModel):
+    """
+    Deterministic local chat model for load tests and replays without a
+    provider. The reply and its timing depend only on the seed and the
+    prompt: a short scene followed by "Option N:" lines (none when the
+    prompt asks for an ending or a summary), streamed at tokens_per_sec
+    after a log-normally distributed first-token latency.
+    """
+
+    model_name: str = "fake-story"
+    temperature: float = 1.0
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+    latency_sigma: float = FAKE_LLM_LATENCY_SIGMA
+    tokens_per_sec: float = FAKE_LLM_TOKENS_PER_SEC
+    seed: int = FAKE_LLM_SEED
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-story"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "seed": self.seed}
+
+    def _rng(self, messages) -> random.Random:
+        prompt = "\0".join(str(message.content) for message in messages)
+        return random.Random(hashlib.sha256(f"{self.seed}\0{prompt}".encode("utf-8")).digest())
+
+    def _reply(self, messages):
+        """
+        Returns (first-token delay in seconds, reply tokens, input token count) for a prompt.
+        """
+        rng = self._rng(messages)
+        delay = rng.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+        text = (
+            f"You arrive at {rng.choice(PLACES)} as {rng.choice(EVENTS)}. "
+            f"Something about this place feels like the turning point of your journey."
+        )
+        instructions = " ".join(str(message.content) for message in messages if message.type == "system")
+        if "Do NOT present any new options" not in instructions and "Summarize" not in instructions:
+            for number, action in enumerate(rng.sample(ACTIONS, 3), 1):
+                text += f"\nOption {number}: {action}"
+        tokens = text.split(" ")
+        tokens = [token + " " for token in tokens[:-1]] + tokens[-1:]
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        return delay, tokens, input_tokens
+
+    def _message_fields(self, tokens, input_tokens) -> dict:
+        return {
+            "usage_metadata": {
+                "input_tokens": input_tokens,
+                "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens),
+            },
+            "response_metadata": {"model_name": self.model_name},
+        }
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, tokens, input_tokens = self._reply(messages)
+        time.sleep(delay + len(tokens) / self.tokens_per_sec)
+        message = AIMessage(content="".join(tokens), **self._message_fields(tokens, input_tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, tokens, input_tokens = self._reply(messages)
+        await asyncio.sleep(delay + len(tokens) / self.tokens_per_sec)
+        message = AIMessage(content="".join(tokens), **self._message_fields(tokens, input_tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, tokens, input_tokens = self._reply(messages)
+        time.sleep(delay)
+        for token in tokens:
+            time.sleep(1 / self.tokens_per_sec)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", **self._message_fields(tokens, input_tokens)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, tokens, input_tokens = self._reply(messages)
+        await asyncio.sleep(delay)
+        for token in tokens:
+            await asyncio.sleep(1 / self.tokens_per_sec)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", **self._message_fields(tokens, input_tokens)))
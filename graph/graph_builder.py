@@ -1,32 +1,65 @@
-from IPython.display import Image, display
+from functools import partial
+from threading import Lock
 from langgraph.graph import StateGraph, START, END
+from .config import DEFAULT_CONFIG, GraphConfig
 from .state import GameState
-from .nodes import initialize_game,generate_next_scenario,increment_counter,end_game,continue_or_end
+from langchain_core.runnables import RunnableLambda
+from .nodes import (
+    initialize_game, ainitialize_game,
+    generate_next_scenario, agenerate_next_scenario,
+    increment_counter,
+    summarize_history, asummarize_history,
+    end_game, aend_game,
+    continue_or_end,
+)
 from langgraph.checkpoint.memory import MemorySaver
+from .checkpointer import get_checkpointer
 
-def build_graph():
+# Process-wide compiled graphs, one per distinct GraphConfig, shared by every
+# game (games differ only by thread_id), and one checkpointer per checkpoint
+# retention setting
+_compiled_graphs = {}
+_compiled_graph_lock = Lock()
+_checkpointers = {}
+
+
+def _node(func, afunc, graph_config: GraphConfig):
+    """
+    Wraps a model-calling node and its async twin, bound to a GraphConfig.
+    """
+    return RunnableLambda(
+        partial(func, graph_config=graph_config),
+        afunc=partial(afunc, graph_config=graph_config),
+        name=func.__name__,
+    )
+
+
+def build_graph(checkpointer=None, graph_config: GraphConfig = DEFAULT_CONFIG):
     """
     Builds and compiles the LangGraph game state machine using GameState as shared state.
     The graph defines the game flow from initialization through scenario generation,
     conditional continuation, and termination, with checkpointing enabled for state persistence.
+    Turn limit and summarization cadence come from graph_config.
     """
     # Create the graph with GameState as the shared state
     GameGraph = StateGraph(GameState)
 
-    # Register nodes
-    GameGraph.add_node("init_game", initialize_game)
-    GameGraph.add_node("next_scenario", generate_next_scenario)
+    # Register nodes (model-calling nodes carry an async twin used by astream/ainvoke)
+    GameGraph.add_node("init_game", _node(initialize_game, ainitialize_game, graph_config))
+    GameGraph.add_node("next_scenario", _node(generate_next_scenario, agenerate_next_scenario, graph_config))
     GameGraph.add_node("IncreaseCount", increment_counter)
-    GameGraph.add_node("game_end", end_game)
+    GameGraph.add_node("summarize", _node(summarize_history, asummarize_history, graph_config))
+    GameGraph.add_node("game_end", _node(end_game, aend_game, graph_config))
 
     # Register Edges
     GameGraph.add_edge(START, "init_game")
     GameGraph.add_edge("init_game", "next_scenario")
     GameGraph.add_conditional_edges("next_scenario", continue_or_end)
-    GameGraph.add_edge("IncreaseCount", "next_scenario")
+    GameGraph.add_edge("IncreaseCount", "summarize")
+    GameGraph.add_edge("summarize", "next_scenario")
     GameGraph.add_edge("game_end", END)
 
-    memory = MemorySaver()
+    memory = checkpointer if checkpointer is not None else MemorySaver()
 
     # Interrupt BEFORE next_scenario so we can collect human input
     graph = GameGraph.compile(
@@ -34,3 +67,22 @@ def build_graph():
         checkpointer=memory
     )
     return graph
+
+def get_graph(graph_config: GraphConfig = DEFAULT_CONFIG):
+    """
+    Returns the process-wide compiled game graph for a config, building it on
+    first use. All games with that config share this graph, and graphs with
+    the same checkpoint retention share the configured checkpointer; each
+    game is isolated by the thread_id passed in the run config.
+    """
+    graph = _compiled_graphs.get(graph_config)
+    if graph is None:
+        with _compiled_graph_lock:
+            graph = _compiled_graphs.get(graph_config)
+            if graph is None:
+                retention = (graph_config.checkpoint_keep_latest, graph_config.checkpoint_compact_every)
+                checkpointer = _checkpointers.get(retention)
+                if checkpointer is None:
+                    checkpointer = _checkpointers[retention] = get_checkpointer(graph_config=graph_config)
+                graph = _compiled_graphs[graph_config] = build_graph(checkpointer, graph_config)
+    return graph
@@ -1,6 +1,307 @@
-from langchain_openai import ChatOpenAI
+import os
+import time
+from collections import deque
+from threading import Lock
 
-model = ChatOpenAI(
-    model="gpt-4o",
-    temperature=1,
-)
+from langchain_core.load import dumps
+from utils.Metrics import get_metrics
+from utils.ProviderGateway import ProviderGateway
+from .state import StoryReply
+from .llm_cache import LLM_CACHE_POLICY, LLM_CACHE_MAX_TEMPERATURE, TieredLLMCache, normalize_prompt
+
+# Chat model provider: "openai", or "fake" for the deterministic local model
+# used by load tests and replays (graph/fake_llm.py)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+
+if LLM_PROVIDER not in ("openai", "fake"):
+    raise ValueError(f"Unsupported LLM provider: {LLM_PROVIDER}")
+if LLM_CACHE_POLICY not in ("off", "opening", "temperature", "always"):
+    raise ValueError(f"Unsupported LLM cache policy: {LLM_CACHE_POLICY}")
+
+# Model tiers. Every node in graph/nodes.py names the tier it calls:
+# - narrative: the opening scene, each continuation and the ending
+# - summary: folding old messages into the running summary
+# - fast: stand-in for a tier whose p95 latency is over its budget
+# Each setting can be overridden with LLM_<TIER>_<SETTING>, e.g. LLM_SUMMARY_MODEL
+TIER_DEFAULTS = {
+    "narrative": {"model": "gpt-4o", "temperature": 1.0, "max_tokens": 1024, "timeout": 60.0,
+                  "fallback": "fast", "p95_budget": 0.0},
+    "summary": {"model": "gpt-4o-mini", "temperature": 0.3, "max_tokens": 400, "timeout": 30.0,
+                "fallback": "", "p95_budget": 0.0},
+    "fast": {"model": "gpt-4o-mini", "temperature": 1.0, "max_tokens": 1024, "timeout": 30.0,
+             "fallback": "", "p95_budget": 0.0},
+}
+
+# The p95 latency of a tier is taken over its calls in the last
+# LLM_LATENCY_WINDOW seconds, once there are at least LLM_LATENCY_MIN_SAMPLES
+LLM_LATENCY_WINDOW = float(os.getenv("LLM_LATENCY_WINDOW", "300"))
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "20"))
+
+
+def tier_settings(tier: str) -> dict:
+    """
+    Returns the settings of a tier: its defaults with LLM_<TIER>_<SETTING> overrides applied.
+    """
+    settings = {}
+    for key, default in TIER_DEFAULTS[tier].items():
+        value = os.getenv(f"LLM_{tier.upper()}_{key.upper()}")
+        settings[key] = default if value is None else type(default)(value)
+    return settings
+
+
+TIERS = {tier: tier_settings(tier) for tier in TIER_DEFAULTS}
+
+for _tier, _settings in TIERS.items():
+    if _settings["fallback"] and _settings["fallback"] not in TIERS:
+        raise ValueError(f"Unknown fallback tier for {_tier}: {_settings['fallback']}")
+
+# Chat models are built on first use (see get_model), so importing the graph
+# does not pull in the provider SDK or open the response cache
+_models = None
+_models_lock = Lock()
+
+# All chat calls go through one gateway: rate limit, retries with jittered
+# backoff and a circuit breaker (the client's own retries are disabled below)
+llm_gateway = ProviderGateway(f"{LLM_PROVIDER}-chat")
+
+# Recent (finished at, seconds) call latencies per tier, for routing
+_latencies = {tier: deque() for tier in TIERS}
+_latencies_lock = Lock()
+
+
+def build_chat_model(settings: dict):
+    """
+    Builds the LLM_PROVIDER chat model for a tier's settings.
+    """
+    if LLM_PROVIDER == "fake":
+        from .fake_llm import FakeStoryModel
+
+        return FakeStoryModel(model_name=f"fake-{settings['model']}", temperature=settings["temperature"])
+
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=settings["model"],
+        temperature=settings["temperature"],
+        max_tokens=settings["max_tokens"],
+        timeout=settings["timeout"],
+        max_retries=0,
+    )
+
+
+def build_models() -> dict:
+    """
+    Builds the chat model of every tier and, when LLM_CACHE_POLICY asks for
+    one, the same model behind the response cache. Returns
+    {"tiers": {tier: (model, cached model or None)}, "cache": cache or None}.
+    """
+    # Response cache in front of the models, applied according to LLM_CACHE_POLICY
+    llm_cache = TieredLLMCache() if LLM_CACHE_POLICY != "off" else None
+
+    tiers = {}
+    for tier, settings in TIERS.items():
+        model = build_chat_model(settings)
+        tiers[tier] = (model, model.model_copy(update={"cache": llm_cache}) if llm_cache else None)
+    return {"tiers": tiers, "cache": llm_cache}
+
+
+def _get_models() -> dict:
+    global _models
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                _models = build_models()
+    return _models
+
+
+def _use_cache(tier: str, opening: bool) -> bool:
+    return LLM_CACHE_POLICY == "always" or (LLM_CACHE_POLICY == "opening" and opening) or (
+        LLM_CACHE_POLICY == "temperature" and TIERS[tier]["temperature"] < LLM_CACHE_MAX_TEMPERATURE
+    )
+
+
+def get_model(tier: str = "narrative", opening: bool = False):
+    """
+    Returns the chat model of a tier, behind the response cache when
+    LLM_CACHE_POLICY applies to it (opening=True for the opening scene).
+    The models are built on first use.
+    """
+    model, cached_model = _get_models()["tiers"][tier]
+    return cached_model if cached_model is not None and _use_cache(tier, opening) else model
+
+
+def get_llm_cache():
+    """
+    Returns the LLM response cache, or None when LLM_CACHE_POLICY is off.
+    """
+    return _get_models()["cache"]
+
+
+def tier_p95(tier: str) -> float | None:
+    """
+    Returns the p95 latency of a tier over the last LLM_LATENCY_WINDOW
+    seconds, or None with fewer than LLM_LATENCY_MIN_SAMPLES calls.
+    """
+    cutoff = time.monotonic() - LLM_LATENCY_WINDOW
+    with _latencies_lock:
+        window = _latencies[tier]
+        while window and window[0][0] < cutoff:
+            window.popleft()
+        samples = sorted(seconds for _, seconds in window)
+    if len(samples) < LLM_LATENCY_MIN_SAMPLES:
+        return None
+    return samples[int(0.95 * (len(samples) - 1))]
+
+
+def tier_stats() -> dict:
+    """
+    Returns the recent p95 latency (0 until there are enough samples) and
+    the sample count of every tier.
+    """
+    stats = {}
+    for tier in TIERS:
+        p95 = tier_p95(tier)
+        with _latencies_lock:
+            samples = len(_latencies[tier])
+        stats[tier] = {"p95_seconds": p95 or 0.0, "samples": samples}
+    return stats
+
+
+def route(tier: str) -> str:
+    """
+    Returns the tier to call: the requested one, or its fallback while the
+    requested tier's p95 latency is over its budget. A tier on fallback
+    gets no new samples, so it is tried again once its window has expired.
+    """
+    settings = TIERS[tier]
+    if settings["fallback"] and settings["p95_budget"] > 0:
+        p95 = tier_p95(tier)
+        if p95 is not None and p95 > settings["p95_budget"]:
+            get_metrics().inc("llm_fallbacks", tier=tier)
+            return settings["fallback"]
+    return tier
+
+
+def _record(tier: str, seconds: float):
+    with _latencies_lock:
+        _latencies[tier].append((time.monotonic(), seconds))
+    get_metrics().observe(f"llm.tier.{tier}", seconds)
+
+
+def _coalesce_key(tier, chat_model, messages):
+    """
+    Identical concurrent prompts only share one call when the response cache
+    applies to the model, i.e. when they would get the same reply anyway.
+    """
+    if getattr(chat_model, "cache", None) is None:
+        return None
+    return f"{tier}\0{normalize_prompt(dumps(messages))}"
+
+
+_story_models = {}
+
+
+def story_model(chat_model):
+    """
+    Returns chat_model asking for a StoryReply in JSON-schema mode, which
+    answers {"raw": AIMessage, "parsed": StoryReply or None}. Models without
+    structured-output support return their plain reply with parsed=None.
+    """
+    entry = _story_models.get(id(chat_model))
+    if entry is None or entry[0] is not chat_model:
+        try:
+            runnable = chat_model.with_structured_output(StoryReply, method="json_schema", include_raw=True)
+        except NotImplementedError:
+            runnable = chat_model | (lambda raw: {"raw": raw, "parsed": None})
+        entry = _story_models[id(chat_model)] = (chat_model, runnable)
+    return entry[1]
+
+
+def _count_tokens(result, tier):
+    """
+    Adds the token usage of a model reply (plain or structured) to the metrics.
+    """
+    message = result["raw"] if isinstance(result, dict) else result
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        metrics = get_metrics()
+        metrics.inc("llm_tokens", usage.get("input_tokens", 0), kind="input", tier=tier)
+        metrics.inc("llm_tokens", usage.get("output_tokens", 0), kind="output", tier=tier)
+
+
+def _timed(tier: str, fn, provider_seconds: list):
+    """
+    Wraps a provider call so each attempt counts towards the tier's latency
+    (failed ones too, e.g. timeouts), without the gateway's rate-limit waits
+    and retry backoff around it. The attempts' durations are appended to
+    provider_seconds.
+    """
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            provider_seconds.append(time.perf_counter() - started)
+            _record(tier, provider_seconds[-1])
+    return timed
+
+
+def _atimed(tier: str, fn, provider_seconds: list):
+    """
+    Async version of _timed.
+    """
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            provider_seconds.append(time.perf_counter() - started)
+            _record(tier, provider_seconds[-1])
+    return timed
+
+
+def _record_queue(started: float, provider_seconds: list):
+    """
+    Records the time a call spent in the gateway outside the provider:
+    rate-limit waits, retry backoff, or waiting on a coalesced call.
+    """
+    get_metrics().observe("llm.queue", time.perf_counter() - started - sum(provider_seconds))
+
+
+def invoke_model(tier: str, messages, structured: bool = False, opening: bool = False):
+    """
+    Calls the model of a tier (or of its fallback, see route) through the
+    LLM gateway, via story_model when a structured story reply is wanted.
+    """
+    tier = route(tier)
+    chat_model = get_model(tier, opening)
+    runnable = story_model(chat_model) if structured else chat_model
+    provider_seconds = []
+    started = time.perf_counter()
+    try:
+        with get_metrics().span("llm.invoke"):
+            result = llm_gateway.call(_coalesce_key(tier, chat_model, messages),
+                                      _timed(tier, runnable.invoke, provider_seconds), messages)
+    finally:
+        _record_queue(started, provider_seconds)
+    _count_tokens(result, tier)
+    return result
+
+
+async def ainvoke_model(tier: str, messages, structured: bool = False, opening: bool = False):
+    """
+    Async version of invoke_model.
+    """
+    tier = route(tier)
+    chat_model = get_model(tier, opening)
+    runnable = story_model(chat_model) if structured else chat_model
+    provider_seconds = []
+    started = time.perf_counter()
+    try:
+        with get_metrics().span("llm.invoke"):
+            result = await llm_gateway.acall(_coalesce_key(tier, chat_model, messages),
+                                             _atimed(tier, runnable.ainvoke, provider_seconds), messages)
+    finally:
+        _record_queue(started, provider_seconds)
+    _count_tokens(result, tier)
+    return result
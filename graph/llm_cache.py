@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+# LLM response cache settings (see .env.example)
+# - off: never cache
+# - opening: cache only the opening scene (initialize_game)
+# - temperature: cache every call while the model temperature is below LLM_CACHE_MAX_TEMPERATURE
+# - always: cache every call
+LLM_CACHE_POLICY = os.getenv("LLM_CACHE_POLICY", "off")
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Reduces a serialized message list to (type, content) pairs with collapsed
+    whitespace, so message ids and provider metadata from earlier replies do
+    not make otherwise identical conversations miss the cache.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    normalized = []
+    for message in messages:
+        kwargs = message.get("kwargs", {}) if isinstance(message, dict) else {}
+        content = kwargs.get("content", "")
+        if isinstance(content, str):
+            content = " ".join(content.split())
+        normalized.append([kwargs.get("type"), content])
+    return json.dumps(normalized, sort_keys=True)
+
+
+def _total_tokens(generations) -> int:
+    """
+    Sums the total_tokens usage recorded on cached chat generations.
+    """
+    total = 0
+    for gen in generations:
+        message = getattr(gen, "message", None)
+        if message is not None and message.usage_metadata:
+            total += message.usage_metadata.get("total_tokens", 0)
+    return total
+
+
+class TieredLLMCache(BaseCache):
+    """
+    Two-tier LangChain response cache: an in-memory LRU in front of a
+    SQLite table on disk. Keys are a hash of the normalized message list and
+    the model parameters (llm_string). Tracks hits, misses and the tokens
+    that cache hits saved.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{normalize_prompt(prompt)}\0{llm_string}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = self.key(prompt, llm_string)
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+            else:
+                row = self.conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = loads(row[0])
+                    self._remember(key, value)
+
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_tokens += _total_tokens(value)
+        # Hand out copies so callers can assign fresh message ids
+        return [gen.model_copy(deep=True) for gen in value]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        key = self.key(prompt, llm_string)
+        # Drop provider message ids: a cached reply must get a new id per use
+        value = [
+            gen.model_copy(update={"message": gen.message.model_copy(update={"id": None})})
+            if getattr(gen, "message", None) is not None else gen
+            for gen in return_val
+        ]
+        with self.lock:
+            self._remember(key, value)
+            self.conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?)", (key, dumps(value)))
+
+    def clear(self, **kwargs) -> None:
+        with self.lock:
+            self.memory.clear()
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counts, the hit ratio and the tokens saved by cache hits.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "saved_tokens": self.saved_tokens,
+            }
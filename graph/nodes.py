@@ -1,46 +1,167 @@
-
 from langchain_core.messages import (
     HumanMessage,
+    RemoveMessage,
     SystemMessage,
+    trim_messages,
 )
+from langchain_core.messages.utils import count_tokens_approximately
 
-from .state import GameState
-from .llm import model
+from utils.StreamingReplyParser import StreamingReplyParser
+from .config import DEFAULT_CONFIG, GraphConfig
+from .state import GameState, StoryReply
+from .llm import ainvoke_model, invoke_model
 from typing_extensions import Literal
 
+# Nodes take the graph's GraphConfig as `graph_config` (bound by build_graph);
+# the name keeps it apart from the RunnableConfig LangGraph passes as `config`
+
 
-def initialize_game(state: GameState):
+def build_prompt(state: GameState, graph_config: GraphConfig):
     """
-    Start node for the game.
-    - Introduce the system rules (SystemMessage)
-    - Generate the very first story scenario (AIMessage)
+    Build the bounded message list sent to the model.
 
+    - The original system prompt (rules and format)
+    - The running story summary, if any
+    - The most recent messages, trimmed to graph_config.history_token_budget
     """
+    messages = state["messages"]
+    system_prompt, history = messages[0], messages[1:]
 
-    system_prompt = SystemMessage(
+    prompt = [system_prompt]
+    if state.get("summary"):
+        prompt.append(SystemMessage(content=f"Summary of the story so far: {state['summary']}"))
+
+    prompt += trim_messages(
+        history,
+        max_tokens=graph_config.history_token_budget,
+        token_counter=count_tokens_approximately,
+        strategy="last",
+    )
+    return prompt
+
+
+def opening_prompt(max_turns: int):
+    """
+    System prompt that introduces the game rules and output format.
+    """
+    return SystemMessage(
         content=(
-            """You are an interactive story game bot. 
+            f"""You are an interactive story game bot. 
             Present a fantastical scenario where the user chooses from 3 options.\n
             After each choice, continue the story and offer 3 new options.\n
-            Start directly with the story—no extra commentary—and format choices as 
-            'Option 1:', 'Option 2:', etc.\n
-            Tailor the scenario so that it ends in 5 responses."""
+            Start directly with the story—no extra commentary. Put the story in
+            'narrative' and the 3 choices, without numbering, in 'options'.\n
+            Tailor the scenario so that it ends in {max_turns} responses."""
         )
     )
 
+
+def continuation_prompt(state: GameState, graph_config: GraphConfig):
+    """
+    Prompt for the next story segment: bounded history plus the latest human choice.
+    """
+    last_human = next(
+        msg for msg in reversed(state["messages"])
+        if isinstance(msg, HumanMessage)
+    )
+
+    return build_prompt(state, graph_config) + [
+        HumanMessage(content=f"The player chose {last_human.content}.")
+    ]
+
+
+def summary_prompt(state: GameState, older):
+    """
+    Prompt that folds the given older messages into the running summary.
+    """
+    transcript = "\n\n".join(f"{msg.type}: {msg.content}" for msg in older)
+
+    return [
+        SystemMessage(
+            content=(
+                """Summarize the interactive story so far in a short paragraph.
+                Keep characters, places, items and the player's choices.
+                Do not invent new events."""
+            )
+        ),
+        HumanMessage(
+            content=f"Previous summary: {state.get('summary') or 'None'}\n\nNew events:\n{transcript}"
+        ),
+    ]
+
+
+def ending_prompt(state: GameState, graph_config: GraphConfig):
+    """
+    Prompt for the final, option-free ending of the story.
+    """
+    return build_prompt(state, graph_config) + [
+        SystemMessage(
+            content=(
+                """The story has reached its conclusion. 
+                Write a definitive ending based on the story so far. 
+                Do NOT present any new options. 
+                End the story conclusively."""
+            )
+        )
+    ]
+
+
+def story_update(reply):
+    """
+    State update for a structured story reply: the narrative becomes the AI
+    message and the choices go to `options`. Replies that do not match the
+    StoryReply schema are parsed from their text instead ('Option N:' lines).
+    """
+    raw, parsed = reply["raw"], reply["parsed"]
+    if parsed is None:
+        parser = StreamingReplyParser()
+        parser.feed(raw.content if isinstance(raw.content, str) else "")
+        parser.finish()
+        parsed = StoryReply(narrative=parser.narrative, options=parser.options)
+    message = raw.model_copy(update={"content": parsed.narrative.strip()})
+    return {"messages": [message], "options": parsed.options}
+
+
+def initialize_game(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
+    """
+    Start node for the game.
+    - Introduce the system rules (SystemMessage)
+    - Generate the very first story scenario (AIMessage)
+    - Fix the game's length (max_turns) for its whole lifetime
+
+    """
+
+    system_prompt = opening_prompt(graph_config.max_turns)
+
     # First model call: only the system message is needed
-    ai_response = model.invoke([system_prompt])
+    # (the opening may be answered from the response cache, see LLM_CACHE_POLICY)
+    reply = story_update(invoke_model("narrative", [system_prompt], structured=True, opening=True))
 
     # Return BOTH messages so they are appended in order
     return {
         "messages": [
             system_prompt,
-            ai_response,
-        ]
+            *reply["messages"],
+        ],
+        "options": reply["options"],
+        "max_turns": graph_config.max_turns,
     }
 
 
-def generate_next_scenario(state: GameState):
+async def ainitialize_game(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
+    """
+    Async version of initialize_game (uses ainvoke_model).
+    """
+    system_prompt = opening_prompt(graph_config.max_turns)
+    reply = story_update(await ainvoke_model("narrative", [system_prompt], structured=True, opening=True))
+    return {
+        "messages": [system_prompt, *reply["messages"]],
+        "options": reply["options"],
+        "max_turns": graph_config.max_turns,
+    }
+
+
+def generate_next_scenario(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
     """
     Generate the next story segment after a human choice.
 
@@ -50,23 +171,17 @@ def generate_next_scenario(state: GameState):
     - This node is resumed after an interrupt
     - Read the latest human choice
     - Tell the model explicitly which option was chosen
-    - Generate the next story + 3 new options
+    - Generate the next story + 3 new options (structured reply)
     """
 
-    messages = state["messages"]
-
-    last_human = next(
-        msg for msg in reversed(messages)
-        if isinstance(msg, HumanMessage)
-    )
-
-    continuation_prompt = HumanMessage(
-        content=f"The player chose {last_human.content}."
-    )
+    return story_update(invoke_model("narrative", continuation_prompt(state, graph_config), structured=True))
 
-    ai_response = model.invoke(messages + [continuation_prompt])
 
-    return {"messages": [ai_response]}
+async def agenerate_next_scenario(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
+    """
+    Async version of generate_next_scenario (uses ainvoke_model).
+    """
+    return story_update(await ainvoke_model("narrative", continuation_prompt(state, graph_config), structured=True))
 
 
 def increment_counter(state: GameState):
@@ -80,6 +195,69 @@ def increment_counter(state: GameState):
     return {"response_count": current + 1}
 
 
+def messages_to_summarize(state: GameState, graph_config: GraphConfig):
+    """
+    Returns the messages older than the history window once the history no
+    longer fits graph_config.history_token_budget (checked every
+    graph_config.summarize_every turns), else an empty list. Until then the
+    summary call is skipped and prompts carry the full history.
+    """
+    if state.get("response_count", 0) % graph_config.summarize_every:
+        return []
+    history = state["messages"][1:]
+    if len(history) <= graph_config.history_window:
+        return []
+    if count_tokens_approximately(history) <= graph_config.history_token_budget:
+        return []
+    return history[:-graph_config.history_window]
+
+
+def summarize_history(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
+    """
+    Fold old messages into the running summary.
+
+    - Runs once the history exceeds graph_config.history_token_budget
+    - Keeps the system prompt and the last graph_config.history_window messages
+    - Summarizes everything older together with the previous summary
+    - Removes the summarized messages from state so they are neither
+      re-sent to the model nor re-checkpointed
+    """
+    older = messages_to_summarize(state, graph_config)
+    if not older:
+        return {}
+
+    summary = invoke_model("summary", summary_prompt(state, older))
+
+    return {
+        "summary": summary.content,
+        "messages": [RemoveMessage(id=msg.id) for msg in older],
+    }
+
+
+async def asummarize_history(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
+    """
+    Async version of summarize_history (uses ainvoke_model).
+    """
+    older = messages_to_summarize(state, graph_config)
+    if not older:
+        return {}
+
+    summary = await ainvoke_model("summary", summary_prompt(state, older))
+
+    return {
+        "summary": summary.content,
+        "messages": [RemoveMessage(id=msg.id) for msg in older],
+    }
+
+
+def game_max_turns(state) -> int:
+    """
+    Returns the game's turn limit, fixed when it started (games checkpointed
+    before the limit was stored use the default config).
+    """
+    return state.get("max_turns") or DEFAULT_CONFIG.max_turns
+
+
 def continue_or_end(state: GameState) -> Literal["IncreaseCount", "game_end"]:
     """
     Decide whether the game should continue or end.
@@ -87,33 +265,30 @@ def continue_or_end(state: GameState) -> Literal["IncreaseCount", "game_end"]:
     This is a pure routing function:
     - No state mutation
     - No narrative logic
-    - Only checks response_count
+    - Only checks response_count against the game's max_turns
     """
-    if state.get("response_count", 0) >= 5:
+    if state.get("response_count", 0) >= game_max_turns(state):
         return "game_end"
     return "IncreaseCount"
 
 
-def end_game(state: GameState):
+def end_game(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
     """
     Generate the final ending of the story.
 
     Responsibilities:
-    - Use the full conversation history
+    - Use the bounded story context (summary + recent messages)
     - Produce a definitive ending
     - Do NOT present any new options
     """
 
-    messages = state["messages"]
+    ai_response = invoke_model("narrative", ending_prompt(state, graph_config))
+    return {"messages": [ai_response], "options": []}
 
-    ending_prompt = SystemMessage(
-        content=(
-            """The story has reached its conclusion. 
-            Write a definitive ending based on the story so far. 
-            Do NOT present any new options. 
-            End the story conclusively."""
-        )
-    )
 
-    ai_response = model.invoke(messages + [ending_prompt])
-    return {"messages": [ai_response]}
\ No newline at end of file
+async def aend_game(state: GameState, graph_config: GraphConfig = DEFAULT_CONFIG):
+    """
+    Async version of end_game (uses ainvoke_model).
+    """
+    ai_response = await ainvoke_model("narrative", ending_prompt(state, graph_config))
+    return {"messages": [ai_response], "options": []}
@@ -1,4 +1,13 @@
 from langgraph.graph import MessagesState
+from pydantic import BaseModel, Field
+
+class StoryReply(BaseModel):
+    """
+    Structured reply requested from the model for every story turn:
+    the scene text and the choices offered to the player.
+    """
+    narrative: str = Field(description="The next part of the story, without the choices")
+    options: list[str] = Field(description="Exactly 3 choices for the player, without numbering")
 
 class GameState(MessagesState):
     """
@@ -7,5 +16,11 @@ class GameState(MessagesState):
     Args:
     - response_count: tracks how many player choices have been made
       (used purely for control flow, not narrative logic)
+    - summary: rolling summary of messages pruned from the history window
+    - options: choices offered by the latest story message (empty once the story has ended)
+    - max_turns: the game's turn limit, fixed by its GraphConfig when it starts
     """
-    response_count: int = 0
\ No newline at end of file
+    response_count: int = 0
+    max_turns: int = 0
+    summary: str = ""
+    options: list[str]
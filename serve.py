@@ -0,0 +1,55 @@
+"""
+Production launcher: runs the ASGI app (asgi.py) in N worker processes on one host.
+
+    FLASK_SECRET_KEY=... python serve.py --workers 4 --port 8000
+
+Workers share nothing in memory, so any worker can serve any request (no
+sticky routing): game state lives in the SQLite checkpointer, image job
+results in a shared SQLite file, the UI state in the signed session cookie,
+and generated images and cached LLM replies on disk.
+"""
+import argparse
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def default_workers() -> int:
+    """
+    WEB_CONCURRENCY if set (and not empty), else one worker per CPU.
+    """
+    return int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+
+def configure_shared_state(workers: int):
+    """
+    Points every shared store at files all workers can see. Raises a
+    ValueError for settings that only work within a single process.
+    """
+    os.environ.setdefault("CHECKPOINTER_BACKEND", "sqlite")
+    os.environ.setdefault("IMAGE_JOBS_BACKEND", "sqlite")
+    if workers > 1:
+        if os.environ["CHECKPOINTER_BACKEND"] != "sqlite":
+            raise ValueError("Multiple workers need CHECKPOINTER_BACKEND=sqlite")
+        if os.environ["IMAGE_JOBS_BACKEND"] != "sqlite":
+            raise ValueError("Multiple workers need IMAGE_JOBS_BACKEND=sqlite")
+        if not os.getenv("FLASK_SECRET_KEY"):
+            raise ValueError("Set FLASK_SECRET_KEY so every worker signs sessions with the same key")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run LLM Journey with multiple worker processes.")
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args(argv)
+
+    configure_shared_state(args.workers)
+    uvicorn.run("asgi:asgi_app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
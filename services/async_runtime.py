@@ -0,0 +1,39 @@
+import asyncio
+import contextvars
+from threading import Lock, Thread
+
+# One long-lived event loop per process that all request threads submit to,
+# so async model/image clients are created once and multiplexed on it
+_loop = None
+_loop_lock = Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the process-wide background event loop, starting it in a
+    daemon thread on first use.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                Thread(target=loop.run_forever, name="async-runtime", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_async(coro, timeout: float | None = None):
+    """
+    Runs a coroutine on the background event loop and blocks the calling
+    (request) thread until its result is available, so the request keeps
+    its thread for the whole turn. The coroutine runs in a
+    copy of the caller's context, so context variables such as the request's
+    metrics trace carry over.
+    """
+    context = contextvars.copy_context()
+
+    async def in_caller_context():
+        return await context.run(asyncio.ensure_future, coro)
+
+    return asyncio.run_coroutine_threadsafe(in_caller_context(), get_loop()).result(timeout)
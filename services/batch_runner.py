@@ -0,0 +1,235 @@
+"""
+Offline batch generation of complete journeys (opening -> choices -> ending).
+
+    python -m services.batch_runner --games 100 --policy random --workers 8 --out data/journeys.jsonl
+    python -m services.batch_runner --games 10 --policy tree --depth 2 --out data/tree.msgpack
+
+Each game is written as one record once it is finished, and its index is
+appended to "<out>.progress", so an interrupted run picks up where it stopped
+when started again with the same arguments. msgpack corpora are a plain
+concatenation of records (read them with msgpack.Unpacker).
+"""
+import argparse
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from threading import Lock
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import ormsgpack
+from langchain_core.callbacks import get_usage_metadata_callback
+from langgraph.checkpoint.memory import MemorySaver
+
+from graph.config import GraphConfig
+from graph.graph_builder import build_graph
+from services.graph_runner import graph_runner
+
+logger = logging.getLogger("batch_runner")
+
+# Safety net in case a story never produces its ending: turns beyond the game's limit
+EXTRA_TURNS = 3
+
+
+def _turn(result):
+    return {"text": result["last_message"], "options": result["options"], "game_over": result["game_over"]}
+
+
+def choose_first(options, rng):
+    return 0
+
+
+def choose_random(options, rng):
+    return rng.randrange(len(options))
+
+
+POLICIES = {"first": choose_first, "random": choose_random}
+
+
+class BatchRunner:
+    """
+    Plays many games against a dedicated graph with bounded parallelism,
+    choosing options by a policy, and appends finished journeys to a corpus.
+    """
+
+    def __init__(self, out: Path, policy: str = "random", depth: int = 1, workers: int = 4,
+                 fmt: str = "jsonl", seed: int = 0, graph_config: GraphConfig | None = None):
+        self.out = Path(out)
+        self.progress_path = self.out.with_name(self.out.name + ".progress")
+        self.policy = policy
+        self.depth = depth
+        self.workers = workers
+        self.fmt = fmt
+        self.seed = seed
+        # A private in-memory graph: finished games are deleted right away
+        self.graph_config = graph_config or GraphConfig()
+        self.graph = build_graph(MemorySaver(), self.graph_config)
+        self.lock = Lock()
+        self.games = 0
+        self.journeys = 0
+        self.tokens = 0
+        self.started = None
+
+    def completed(self) -> set[int]:
+        """
+        Returns the indices of the games already written by earlier runs.
+        """
+        if not self.progress_path.exists():
+            return set()
+        return {int(line) for line in self.progress_path.read_text().split() if line.isdigit()}
+
+    def _runner(self, thread_id):
+        return graph_runner(thread_id, self.graph)
+
+    def _play(self, runner, turns, choose, rng):
+        """
+        Plays a game from its current checkpoint to the ending, i.e. until a
+        turn offers no options (the final scenario still offers some, and
+        the choice among them leads to game_end). turns holds the turns
+        played so far and is extended in place.
+        """
+        while len(turns) < self.graph_config.max_turns + EXTRA_TURNS:
+            options = turns[-1]["options"]
+            if not options:
+                break
+            index = choose(options, rng)
+            turns[-1]["choice"] = index
+            result = runner.run_graph_turn(user_input=options[index])
+            turns.append(_turn(result))
+        self.graph.checkpointer.delete_thread(runner.thread_id)
+        return turns
+
+    def _explore(self, runner, turns, level, path):
+        """
+        Branches on every option for the first `depth` choices, then plays
+        each branch on to its ending with the first option. Returns
+        (path, turns) for every leaf.
+        """
+        options = turns[-1]["options"]
+        if level >= self.depth or not options:
+            return [(path, self._play(runner, turns, choose_first, None))]
+        leaves = []
+        for index, option in enumerate(options):
+            branch = runner.fork(f"{runner.thread_id}/{index}")
+            branch_turns = [dict(turn) for turn in turns]
+            branch_turns[-1]["choice"] = index
+            result = branch.run_graph_turn(user_input=option)
+            branch_turns.append(_turn(result))
+            leaves += self._explore(branch, branch_turns, level + 1, path + [index])
+        self.graph.checkpointer.delete_thread(runner.thread_id)
+        return leaves
+
+    def run_game(self, game: int):
+        """
+        Plays game number `game` and returns its journey records and token usage.
+        """
+        started = time.perf_counter()
+        runner = self._runner(f"batch-{self.seed}-{game}")
+        with get_usage_metadata_callback() as usage:
+            opening = runner.run_graph_turn()
+            turns = [_turn(opening)]
+            if self.policy == "tree":
+                leaves = self._explore(runner, turns, 0, [])
+            else:
+                rng = random.Random(f"{self.seed}:{game}")
+                leaves = [([], self._play(runner, turns, POLICIES[self.policy], rng))]
+        tokens = sum(u.get("total_tokens", 0) for u in usage.usage_metadata.values())
+        seconds = round(time.perf_counter() - started, 3)
+        records = [
+            {
+                "game": game,
+                "path": path,
+                "policy": self.policy,
+                "turns": [{"text": t["text"], "options": t["options"], "choice": t.get("choice")} for t in leaf],
+                "tokens": tokens,
+                "seconds": seconds,
+            }
+            for path, leaf in leaves
+        ]
+        return records, tokens
+
+    def _write(self, game, records, tokens):
+        """
+        Appends a finished game's records, then marks the game as done.
+        """
+        with self.lock:
+            if self.fmt == "msgpack":
+                with self.out.open("ab") as f:
+                    f.write(b"".join(ormsgpack.packb(r) for r in records))
+            else:
+                with self.out.open("a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records))
+            with self.progress_path.open("a") as f:
+                f.write(f"{game}\n")
+            self.games += 1
+            self.journeys += len(records)
+            self.tokens += tokens
+
+    def throughput(self) -> dict:
+        """
+        Returns games/min and tokens/sec for this run.
+        """
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "games": self.games,
+            "journeys": self.journeys,
+            "games_per_min": round(self.games * 60 / elapsed, 2),
+            "tokens_per_sec": round(self.tokens / elapsed, 1),
+        }
+
+    def run(self, games: int, report_every: float = 10.0) -> dict:
+        """
+        Runs every game not yet in the corpus and returns the final throughput.
+        """
+        self.out.parent.mkdir(parents=True, exist_ok=True)
+        done = self.completed()
+        todo = [game for game in range(games) if game not in done]
+        logger.info("%d games to play (%d already done)", len(todo), games - len(todo))
+        self.started = time.perf_counter()
+        reported = self.started
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            futures = {executor.submit(self.run_game, game): game for game in todo}
+            for future in as_completed(futures):
+                game = futures[future]
+                try:
+                    records, tokens = future.result()
+                except Exception:
+                    # Left out of the progress file, so the next run retries it
+                    logger.exception("game %d failed", game)
+                    continue
+                self._write(game, records, tokens)
+                if time.perf_counter() - reported >= report_every:
+                    reported = time.perf_counter()
+                    logger.info("progress %s", self.throughput())
+        stats = self.throughput()
+        logger.info("done %s", stats)
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate complete journeys into a JSONL/msgpack corpus.")
+    parser.add_argument("--games", type=int, default=10, help="number of games (tree roots for --policy tree)")
+    parser.add_argument("--policy", choices=["random", "first", "tree"], default="random")
+    parser.add_argument("--depth", type=int, default=1, help="tree policy: branch on every option for this many choices")
+    parser.add_argument("--workers", type=int, default=4, help="games played concurrently")
+    parser.add_argument("--out", type=Path, default=Path("data/journeys.jsonl"))
+    parser.add_argument("--format", choices=["jsonl", "msgpack"], default=None, help="default: from the --out extension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-turns", type=int, default=GraphConfig().max_turns, help="player choices per game")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between throughput reports")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    fmt = args.format or ("msgpack" if args.out.suffix == ".msgpack" else "jsonl")
+    graph_config = GraphConfig(max_turns=args.max_turns)
+    runner = BatchRunner(args.out, args.policy, args.depth, args.workers, fmt, args.seed, graph_config)
+    print(json.dumps(runner.run(args.games, args.report_every)))
+
+
+if __name__ == "__main__":
+    main()
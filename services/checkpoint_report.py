@@ -0,0 +1,83 @@
+"""
+Reports the checkpoint bytes retained per thread (game) in the checkpoint
+database, and optionally compacts it to the GraphConfig checkpoint retention
+(CHECKPOINT_KEEP_LATEST).
+
+    python -m services.checkpoint_report --top 10
+    python -m services.checkpoint_report --path data/checkpoints.sqlite --compact --out report.json
+
+The in-memory checkpointer lives inside the serving process; its per-game
+footprint is served by /sessions/stats, and replay_bench reports it for
+replayed games.
+"""
+import argparse
+import json
+import math
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from graph.checkpointer import CHECKPOINTER_PATH, SQLiteSaver, checkpoint_bytes
+from graph.config import GraphConfig
+
+
+def _percentile(values: list[int], q: float) -> int:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)] if ordered else 0
+
+
+def report(checkpointer, top: int = 10) -> dict:
+    """
+    Returns the total and per-thread distribution of checkpoint bytes, with
+    the top largest threads and their checkpoint counts.
+    """
+    sizes = checkpoint_bytes(checkpointer)
+    per_thread = list(sizes.values())
+    with checkpointer._connection() as conn:
+        counts = dict(conn.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id"))
+    largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "threads": len(sizes),
+        "checkpoints": sum(counts.values()),
+        "bytes": sum(per_thread),
+        "file_bytes": checkpointer.path.stat().st_size,
+        "bytes_per_thread": {
+            f"p{q}": _percentile(per_thread, q) for q in (50, 95, 99)
+        } | {"max": max(per_thread, default=0)},
+        "largest": [
+            {"thread_id": thread_id, "bytes": size, "checkpoints": counts.get(thread_id, 0)}
+            for thread_id, size in largest
+        ],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report checkpoint bytes per thread in the checkpoint database.")
+    parser.add_argument("--path", type=Path, default=Path(CHECKPOINTER_PATH), help="SQLite checkpoint database")
+    parser.add_argument("--top", type=int, default=10, help="largest threads to list")
+    parser.add_argument("--compact", action="store_true",
+                        help="first keep only the latest --keep-latest checkpoints of every thread")
+    parser.add_argument("--keep-latest", type=int, default=GraphConfig().checkpoint_keep_latest or 4)
+    parser.add_argument("--out", type=Path, help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not args.path.exists():
+        raise SystemExit(f"No checkpoint database at {args.path}")
+    checkpointer = SQLiteSaver(args.path, pool_size=1, keep_latest=args.keep_latest)
+    try:
+        before = report(checkpointer, args.top)
+        result = before
+        if args.compact:
+            deleted = sum(checkpointer.compact(thread_id) for thread_id in checkpoint_bytes(checkpointer))
+            result = report(checkpointer, args.top) | {"compacted_checkpoints": deleted, "bytes_before": before["bytes"]}
+    finally:
+        checkpointer.close()
+    print(json.dumps(result, indent=2))
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,360 @@
-from langchain_core.messages import HumanMessage
-from graph.graph_builder import build_graph
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from threading import Lock
+from typing import TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from graph.checkpointer import copy_checkpoint
+from graph.graph_builder import get_graph
+from graph.nodes import game_max_turns
+from services.turn_scheduler import TURN_QUEUE_TIMEOUT, TurnBusy, get_turn_scheduler
+from utils.Metrics import get_metrics
+from utils.StreamingReplyParser import StreamingReplyParser
+
+# Nodes whose streamed tokens make up the story text shown to the player
+NARRATIVE_NODES = ("init_game", "next_scenario", "game_end")
+
+# Requests allowed to wait for a game's running turn (e.g. double submits)
+# before further ones are turned away as busy
+TURN_MAX_WAITING_PER_GAME = int(os.getenv("TURN_MAX_WAITING_PER_GAME", "4"))
+
+
+class StaleTurn(RuntimeError):
+    """
+    Raised for a choice submitted for a turn the game is not at (e.g. from an
+    old tab after another one moved on); served as HTTP 409. current_turn is
+    the turn number the game expects next.
+    """
+
+    def __init__(self, message: str, current_turn: int):
+        super().__init__(message)
+        self.current_turn = current_turn
+
+
+class TurnResult(TypedDict):
+    """
+    Outcome of one game turn, read from the final streamed graph state.
+    """
+    last_message: str | None
+    options: list[str]
+    response_count: int
+    game_over: bool
+
+
+class _NarrativeWatcher:
+    """
+    Feeds streamed story tokens into a StreamingReplyParser and fires a
+    callback once with the narrative paragraph, as soon as the first option
+    marker appears (or with the full reply at the end of the turn).
+    """
+
+    def __init__(self, on_narrative):
+        self.on_narrative = on_narrative
+        self.parser = StreamingReplyParser()
+        self.fired = on_narrative is None
+
+    def feed(self, token):
+        self.parser.feed(token)
+        if not self.fired and self.parser.narrative_complete:
+            self._fire(self.parser.narrative)
+
+    def finish(self, last_message):
+        if not self.fired and last_message:
+            self._fire(last_message)
+
+    def _fire(self, narrative):
+        self.fired = True
+        self.on_narrative(narrative)
+
+
+def _story_token(chunk):
+    """
+    Returns (message id, text) for a "messages" stream event that belongs to the story, else None.
+    """
+    message, metadata = chunk
+    if not isinstance(message, AIMessage) or metadata.get("langgraph_node") not in NARRATIVE_NODES:
+        return None
+    if not isinstance(message.content, str) or not message.content:
+        return None
+    return message.id, message.content
+
 
 class graph_runner:
-    def __init__(self,thread_id):
-        self.graph = build_graph()
+    """
+    Lightweight per-game handle onto the shared compiled game graph.
+    Holds the game's thread_id, the options offered at its latest turn and
+    the lock that serializes its turns; all graph structure and checkpoint
+    storage are shared process-wide via get_graph(), unless a separately
+    built graph is passed in (e.g. by the batch runner).
+    """
+
+    def __init__(self,thread_id, graph=None):
+        self.graph = graph if graph is not None else get_graph()
         self.thread_id = thread_id
+        # (turn number, options) from the last turn this handle served
+        self.turn_options = None
+        # (turn number, TurnResult) of the last player turn, for duplicate submissions
+        self.last_turn = None
+        self.turn_lock = Lock()
+        self.waiting_lock = Lock()
+        self.waiting = 0
 
-    def run_graph_turn(
+    def fork(self, thread_id):
+        """
+        Copies this game's latest checkpoint into a new thread and returns a
+        runner for it, so the copy can continue independently from here.
+        """
+        copy_checkpoint(self.graph, self.thread_id, thread_id)
+        return graph_runner(thread_id, self.graph)
+
+    def _thread(self):
+        return {"configurable": {"thread_id": self.thread_id}}
+
+    def _turn_input(self, user_input: str | None):
+        """
+        Returns the stream input for a turn: None to resume after an injected
+        human message, or an empty input to start/resume the graph.
+        """
+        # After injecting a new message, we need to process it → use None
+        # No new user input (e.g. first call to resume after interrupt) → just resume
+        return None if user_input is not None else {}
+
+    def _stream_modes(self, tokens):
+        """
+        Token ("messages") events are only streamed when someone consumes them.
+        """
+        return ["values", "messages"] if tokens else ["values"]
+
+    def _turn_result(self, final_state) -> TurnResult:
+        """
+        Builds the turn result from the last "values" event of the turn, i.e.
+        the graph state at the interrupt (or at the end of the game).
+        """
+        if final_state is None:
+            return TurnResult(last_message=None, options=[], response_count=0, game_over=True)
+
+        response_count = final_state.get("response_count", 0)
+        return TurnResult(
+            last_message=final_state["messages"][-1].content,
+            options=final_state.get("options", []),
+            response_count=response_count,
+            game_over=response_count >= game_max_turns(final_state),
+        )
+
+    def current_turn(self) -> TurnResult:
+        """
+        Returns the result of the game's latest turn, read from its checkpoint,
+        e.g. to show it again after a page reload.
+        """
+        return self._turn_result(self.graph.get_state(self._thread()).values or None)
+
+    def _last_played_turn(self, snapshot) -> int:
+        """
+        Returns the number of the latest player turn stored in a checkpoint
+        snapshot: 0 for the opening, N after choice N (response_count N), the
+        turn after the last choice once the ending is stored, and -1 before
+        the game has started.
+        """
+        if not snapshot.values:
+            return -1
+        played = snapshot.values.get("response_count") or 0
+        # The ending does not advance response_count and leaves nothing to run
+        return played + 1 if not snapshot.next else played
+
+    @contextmanager
+    def turn_slot(self, turn: int):
+        """
+        Guards player turn number `turn` of this game. Turns of one game run
+        one at a time, and a submission for the turn just played (a double
+        submit, or another tab) waits for it and gets its result: the block
+        receives that TurnResult, or None when the turn is to be run, in
+        which case it runs in a slot of the turn scheduler. The turn just
+        played is read from the checkpoint, so this also holds after the
+        handle was evicted, or when another worker played it. Raises
+        StaleTurn for an older turn, and TurnBusy when too many requests
+        wait for the game or for a slot.
+        """
+        self._acquire_turn()
+        try:
+            if self.last_turn is not None and self.last_turn[0] == turn:
+                get_metrics().inc("turns_collapsed")
+                yield self.last_turn[1]
+                return
+            with self._turn_lease():
+                snapshot = self.graph.get_state(self._thread())
+                played = self._last_played_turn(snapshot)
+                if turn < played:
+                    raise StaleTurn(f"turn {turn} is stale, the game is at turn {played + 1}", played + 1)
+                if turn == played:
+                    get_metrics().inc("turns_collapsed")
+                    yield self._turn_result(snapshot.values)
+                    return
+                with get_turn_scheduler().slot(self.thread_id):
+                    yield None
+        finally:
+            self.turn_lock.release()
+
+    @contextmanager
+    def _turn_lease(self):
+        """
+        Holds the game's turn lease in the checkpointer when it has one
+        (SQLiteSaver), so worker processes sharing it run the game's turns
+        one at a time. Raises TurnBusy when another worker's turn outlasts
+        TURN_QUEUE_TIMEOUT.
+        """
+        turn_lease = getattr(self.graph.checkpointer, "turn_lease", None)
+        with ExitStack() as stack:
+            if turn_lease is not None:
+                try:
+                    stack.enter_context(turn_lease(self.thread_id, TURN_QUEUE_TIMEOUT))
+                except TimeoutError:
+                    raise TurnBusy("timed out waiting for this game's turn on another worker",
+                                   retry_after=TURN_QUEUE_TIMEOUT) from None
+            yield
+
+    def _acquire_turn(self):
+        """
+        Takes the game's turn lock, waiting behind its running turn unless
+        TURN_MAX_WAITING_PER_GAME requests already do.
+        """
+        if self.turn_lock.acquire(blocking=False):
+            return
+        with self.waiting_lock:
+            if self.waiting >= TURN_MAX_WAITING_PER_GAME:
+                raise TurnBusy("too many requests for this game")
+            self.waiting += 1
+        try:
+            acquired = self.turn_lock.acquire(timeout=TURN_QUEUE_TIMEOUT)
+        finally:
+            with self.waiting_lock:
+                self.waiting -= 1
+        if not acquired:
+            raise TurnBusy("timed out waiting for this game's turn", retry_after=TURN_QUEUE_TIMEOUT)
+
+    def remember_turn(self, turn: int, result: TurnResult):
+        """
+        Records the result of player turn `turn`, for duplicate submissions
+        of it, and caches the options it offered for turn `turn + 1`.
+        """
+        self.last_turn = (turn, result)
+        self.remember_options(turn + 1, result["options"])
+
+    def remember_options(self, turn: int, options: list[str]):
+        """
+        Caches the options offered after turn number `turn`.
+        """
+        self.turn_options = (turn, options)
+
+    def options_for_turn(self, turn: int) -> list[str]:
+        """
+        Returns the options offered after turn number `turn`: from the cache
+        when it holds that turn, else from the checkpoint (e.g. after this
+        handle was evicted, or when another worker served the last turn).
+        Raises StaleTurn when the checkpoint is not at that turn, instead of
+        offering another turn's options. The turn just played is let through:
+        repeats of it are answered by turn_slot with that turn's result.
+        """
+        if self.turn_options is not None and self.turn_options[0] == turn:
+            return self.turn_options[1]
+        values = self.graph.get_state(self._thread()).values
+        options = values.get("options", [])
+        # Options offered after player turn N are checkpointed with response_count N
+        current_turn = values.get("response_count", 0) + 1
+        if options and turn not in (current_turn - 1, current_turn):
+            raise StaleTurn(f"turn {turn} is stale, the game is at turn {current_turn}", current_turn)
+        self.remember_options(turn, options)
+        return options
+
+    def stream_graph_turn(
         self,
-        user_input: str | None = None
+        user_input: str | None = None,
+        on_narrative=None,
+        tokens: bool = True
     ):
-        thread = {"configurable": {"thread_id": self.thread_id}}
+        """
+        Runs one game turn as a generator. Yields ("token", text) for each
+        streamed piece of story text (when tokens is True), ("reset", None)
+        when a later story message replaces the one streamed so far (e.g. the
+        ending after a final scenario), and finally ("result", TurnResult).
+        on_narrative, if given, is called with the story paragraph as soon as
+        it has streamed out, before the options.
+        """
+        thread = self._thread()
+        metrics = get_metrics()
 
         # If this is a new user turn: inject the message first
         if user_input is not None:
-            self.graph.update_state(
-                thread,
-                {"messages": HumanMessage(content=user_input)},
-            )
-            # After injecting a new message, we need to process it → use None
-            input_for_stream = None
-        else:
-            # No new user input (e.g. first call to resume after interrupt) → just resume
-            input_for_stream = {}
-
-        # Run one turn
-        events = list(self.graph.stream(input_for_stream, thread, stream_mode="values"))
-
-        if not events:
-            return {
-                "last_message": None,
-                "game_over": True
-            }
-
-        last_event = events[-1]
-        last_message = last_event["messages"][-1]
-
-        # Get current state for response count
-        state = self.graph.get_state(thread)
-        response_count = state.values.get("response_count", 0)
-
-        return {
-            "last_message": last_message.content,
-            "response_count": response_count,
-            "game_over": response_count >= 5
-        }
\ No newline at end of file
+            with metrics.span("graph.update_state"):
+                self.graph.update_state(
+                    thread,
+                    {"messages": HumanMessage(content=user_input)},
+                )
+
+        # Run one turn (the span includes the time consumers spend on each yielded token).
+        # Only the latest "values" event is kept: each one holds the whole state
+        final_state = None
+        watcher = _NarrativeWatcher(on_narrative)
+        message_id = None
+        stream_started = time.perf_counter()
+        for mode, chunk in self.graph.stream(self._turn_input(user_input), thread, stream_mode=self._stream_modes(tokens)):
+            if mode == "values":
+                final_state = chunk
+            elif (token := _story_token(chunk)) is not None:
+                if token[0] != message_id:
+                    if message_id is not None:
+                        yield "reset", None
+                    message_id = token[0]
+                watcher.feed(token[1])
+                yield "token", token[1]
+        metrics.observe("graph.stream", time.perf_counter() - stream_started)
+
+        result = self._turn_result(final_state)
+        watcher.finish(result["last_message"])
+        yield "result", result
+
+    def run_graph_turn(
+        self,
+        user_input: str | None = None,
+        on_narrative=None
+    ) -> TurnResult:
+        """
+        Runs one game turn and returns its result. If on_narrative is given,
+        it is called with the story paragraph as soon as it has streamed out,
+        so slow follow-up work (e.g. images) can start early.
+        """
+        for kind, payload in self.stream_graph_turn(user_input, on_narrative, tokens=on_narrative is not None):
+            if kind == "result":
+                return payload
+
+    async def arun_graph_turn(
+        self,
+        user_input: str | None = None,
+        on_narrative=None
+    ) -> TurnResult:
+        """
+        Async version of run_graph_turn using aupdate_state/astream, so the
+        model calls inside the nodes are awaited instead of blocking a thread.
+        """
+        thread = self._thread()
+        metrics = get_metrics()
+
+        if user_input is not None:
+            with metrics.span("graph.update_state"):
+                await self.graph.aupdate_state(
+                    thread,
+                    {"messages": HumanMessage(content=user_input)},
+                )
+
+        final_state = None
+        watcher = _NarrativeWatcher(on_narrative)
+        with metrics.span("graph.stream"):
+            async for mode, chunk in self.graph.astream(self._turn_input(user_input), thread, stream_mode=self._stream_modes(on_narrative is not None)):
+                if mode == "values":
+                    final_state = chunk
+                elif (token := _story_token(chunk)) is not None:
+                    watcher.feed(token[1])
+
+        result = self._turn_result(final_state)
+        watcher.finish(result["last_message"])
+        return result
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sqlite3
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+
+from services.async_runtime import get_loop
+
+# Background image generation so a turn renders without waiting for the image
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "8"))
+MAX_IMAGE_JOBS = int(os.getenv("MAX_IMAGE_JOBS", "1000"))
+# "memory": jobs can only be polled on the worker that started them;
+# "sqlite": job results are shared through a file so any worker can answer a poll
+IMAGE_JOBS_BACKEND = os.getenv("IMAGE_JOBS_BACKEND", "memory")
+IMAGE_JOBS_PATH = os.getenv("IMAGE_JOBS_PATH", "data/image_jobs.sqlite")
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-job")
+_jobs = OrderedDict()
+_jobs_lock = Lock()
+_store = None
+
+
+class _SQLiteJobStore:
+    """
+    Job statuses shared by every worker process through one SQLite file.
+    Only the newest MAX_IMAGE_JOBS jobs are kept.
+    """
+
+    def __init__(self, path: str = IMAGE_JOBS_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, url TEXT)"
+        )
+        self.lock = Lock()
+
+    def set(self, job_id: str, status: str, url: str | None = None):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO image_jobs VALUES (?, ?, ?)", (job_id, status, url))
+            self.conn.execute(
+                "DELETE FROM image_jobs WHERE rowid <= (SELECT MAX(rowid) FROM image_jobs) - ?",
+                (MAX_IMAGE_JOBS,),
+            )
+
+    def get(self, job_id: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute("SELECT status, url FROM image_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "url": row[1]} if row[1] else {"status": row[0]}
+
+
+def _get_store() -> _SQLiteJobStore | None:
+    """
+    Returns the shared job store, or None for the in-memory backend.
+    """
+    global _store
+    if IMAGE_JOBS_BACKEND == "memory":
+        return None
+    if IMAGE_JOBS_BACKEND != "sqlite":
+        raise ValueError(f"Unsupported image jobs backend: {IMAGE_JOBS_BACKEND}")
+    if _store is None:
+        with _jobs_lock:
+            if _store is None:
+                _store = _SQLiteJobStore()
+    return _store
+
+
+def _status(future) -> dict:
+    if not future.done():
+        return {"status": "pending"}
+    if future.exception() is not None:
+        return {"status": "error"}
+    return {"status": "done", "url": future.result()}
+
+
+def submit_image_job(api, model_name: str, prompt: str, use_async: bool = False) -> str:
+    """
+    Starts generating an image for the prompt in the background and returns a job id.
+    Async mode schedules api.aget_img on the shared event loop; otherwise
+    api.get_img runs on a bounded thread pool.
+    """
+    if use_async:
+        future = asyncio.run_coroutine_threadsafe(api.aget_img(model_name, prompt), get_loop())
+    else:
+        future = _executor.submit(api.get_img, model_name, prompt)
+
+    job_id = uuid.uuid4().hex
+    if (store := _get_store()) is not None:
+        store.set(job_id, "pending")
+        future.add_done_callback(lambda f: store.set(job_id, **_status(f)))
+    with _jobs_lock:
+        _jobs[job_id] = future
+        # Forget the oldest jobs so abandoned pages cannot grow the registry forever
+        while len(_jobs) > MAX_IMAGE_JOBS:
+            _jobs.popitem(last=False)
+    return job_id
+
+
+def get_image_job(job_id: str) -> dict | None:
+    """
+    Returns the job status ("pending", "done" with its url, or "error"),
+    or None if the job id is unknown or already expired. Jobs started by
+    other workers are looked up in the shared store, if there is one.
+    """
+    with _jobs_lock:
+        future = _jobs.get(job_id)
+    if future is not None:
+        return _status(future)
+    if (store := _get_store()) is not None:
+        return store.get(job_id)
+    return None
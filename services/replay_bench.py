@@ -0,0 +1,690 @@
+"""
+Replays recorded sessions against the fake providers to measure throughput,
+latency and memory without network access or API spend.
+
+    python -m services.replay_bench --target graph --sessions 50 --concurrency 8
+    python -m services.replay_bench --target flask --traces data/journeys.jsonl --out bench.json
+
+A trace is one JSON object per line with the option index chosen at each
+turn, {"choices": [0, 2, 1]}; batch_runner corpora can be replayed as they
+are. Without --traces, --sessions random traces are generated from --seed.
+--turn-stats reports latency at given turn numbers and, on the graph
+target, the size of the game's latest checkpoint and the checkpoint reads
+of the turn (plus its peak allocation with --trace-memory, meaningful at
+--concurrency 1), e.g. for long campaigns:
+
+    python -m services.replay_bench --max-turns 50 --turns 50 --turn-stats 5,20,50 --concurrency 1 --trace-memory
+
+The graph target keeps its checkpoints in memory under the compaction
+policy given by --keep-latest and --dedup-messages, e.g. to compare the
+footprint retained by 1,000 games with and without compaction:
+
+    python -m services.replay_bench --sessions 1000 --keep-latest 0
+    python -m services.replay_bench --sessions 1000 --keep-latest 4 --dedup-messages
+
+--duplicates N submits every turn of the flask target N times at once with
+the same session cookie (a double-clicked form, several tabs). The run fails
+unless every copy gets the same reply and the story model was called
+exactly once per turn:
+
+    python -m services.replay_bench --target flask --sessions 50 --duplicates 3
+
+--compare-async replays the same traces through the flask target twice,
+with ASYNC_MODE off and on, and reports both runs side by side:
+
+    python -m services.replay_bench --target flask --sessions 200 --concurrency 200 --compare-async
+
+--target http plays the games over HTTP against worker processes, each
+turn on a different worker than the one before, either at --urls or on
+--spawn-workers serve.py processes started for the run (one run per
+count), e.g. to check that duplicates across workers still run once and
+how throughput changes with the worker count:
+
+    python -m services.replay_bench --target http --spawn-workers 1,2,4 --sessions 60 --concurrency 60
+
+--importtime measures "import app" in fresh interpreters instead, and
+fails when it exceeds --max-import-ms or imports a provider SDK eagerly:
+
+    python -m services.replay_bench --importtime --max-import-ms 1500
+
+Providers default to the fakes (LLM_PROVIDER/IMAGE_PROVIDER=fake) and the
+gateway rate limit is lifted, so only the app itself is measured.
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("IMAGE_PROVIDER", "fake")
+os.environ.setdefault("PROVIDER_RATE_LIMIT", "100000")
+os.environ.setdefault("PROVIDER_BURST", "100000")
+
+from graph.checkpointer import (
+    CHECKPOINT_DEDUP_MESSAGES,
+    CompactingMemorySaver,
+    SQLiteSaver,
+    checkpoint_bytes,
+)
+from graph.config import GraphConfig
+from graph.graph_builder import build_graph, get_graph
+from services.graph_runner import graph_runner
+from utils.Metrics import Metrics, get_metrics, start_trace, stop_trace
+
+logger = logging.getLogger("replay_bench")
+
+
+def load_traces(path: Path) -> list[list[int]]:
+    """
+    Reads traces from a JSONL file of {"choices": [...]} objects or batch_runner records.
+    """
+    traces = []
+    with Path(path).open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "choices" in record:
+                traces.append(record["choices"])
+            else:
+                traces.append([t["choice"] for t in record["turns"] if t.get("choice") is not None])
+    return traces
+
+
+def random_traces(sessions: int, turns: int, seed: int) -> list[list[int]]:
+    rng = random.Random(seed)
+    return [[rng.randrange(3) for _ in range(turns)] for _ in range(sessions)]
+
+
+def narrative_calls() -> int:
+    """
+    Returns how many times the graph has called the narrative tier so far.
+    """
+    histogram = get_metrics().spans.get("llm.tier.narrative")
+    return histogram.count if histogram else 0
+
+
+def span_count() -> int:
+    """
+    Returns how many spans have been recorded so far.
+    """
+    return sum(histogram.count for histogram in list(get_metrics().spans.values()))
+
+
+def metrics_overhead(spans_per_turn: float, incs_per_turn: float, samples: int = 200_000) -> dict:
+    """
+    Times Metrics.span (outside and inside a request trace) and Metrics.inc
+    on a private registry, and scales them by the spans and counter
+    increments a turn records, as measured by the replay.
+    """
+    metrics = Metrics()
+
+    def per_call(fn) -> float:
+        started = time.perf_counter()
+        for _ in range(samples):
+            fn()
+        return (time.perf_counter() - started) / samples
+
+    def span():
+        with metrics.span("bench"):
+            pass
+
+    baseline = per_call(lambda: None)
+    span_seconds = per_call(span) - baseline
+    start_trace()
+    try:
+        traced_seconds = per_call(span) - baseline
+    finally:
+        stop_trace()
+    inc_seconds = per_call(lambda: metrics.inc("bench", 1, kind="output")) - baseline
+    return {
+        "spans_per_turn": round(spans_per_turn, 2),
+        "incs_per_turn": round(incs_per_turn, 2),
+        "span_ns": round(span_seconds * 1e9),
+        "traced_span_ns": round(traced_seconds * 1e9),
+        "inc_ns": round(inc_seconds * 1e9),
+        "us_per_turn": round((spans_per_turn * traced_seconds + incs_per_turn * inc_seconds) * 1e6, 2),
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of values (q between 0 and 100).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class GraphTarget:
+    """
+    Plays sessions directly on graph_runner, against a private graph whose
+    checkpointer applies the retention of graph_config. The
+    checkpointer is in memory, or a SQLiteSaver on a temporary file. With
+    graph_per_session, every session builds and keeps its own graph and
+    checkpointer instead, as games did before the graph was shared.
+    """
+
+    name = "graph"
+
+    def __init__(
+        self,
+        graph_config: GraphConfig | None = None,
+        turn_stats=(),
+        dedup_messages: bool = CHECKPOINT_DEDUP_MESSAGES,
+        graph_per_session: bool = False,
+        backend: str = "memory",
+    ):
+        self.graph_config = graph_config or GraphConfig()
+        self.backend = backend
+        # Removed when the target is collected, at the latest on exit
+        self.directory = tempfile.TemporaryDirectory(prefix="replay-") if backend == "sqlite" else None
+        self.databases = itertools.count()
+        self.dedup_messages = dedup_messages
+        self.graph_per_session = graph_per_session
+        self.reads = Counter()  # thread_id -> checkpoint reads
+        self.reads_lock = threading.Lock()
+        self.graphs = [] if graph_per_session else [self._build_graph()]
+        self.turn_stats = set(turn_stats)
+
+    def _build_graph(self):
+        policy = {
+            "keep_latest": self.graph_config.checkpoint_keep_latest,
+            "compact_every": self.graph_config.checkpoint_compact_every,
+            "dedup_messages": self.dedup_messages,
+        }
+        if self.backend == "sqlite":
+            checkpointer = SQLiteSaver(Path(self.directory.name) / f"checkpoints-{next(self.databases)}.sqlite", **policy)
+        else:
+            checkpointer = CompactingMemorySaver(**policy)
+        self._count_reads(checkpointer)
+        return build_graph(checkpointer, self.graph_config)
+
+    def _count_reads(self, checkpointer):
+        """
+        Counts the checkpoint loads (get_tuple calls) per thread on the checkpointer.
+        """
+        get_tuple = checkpointer.get_tuple
+
+        def counting_get_tuple(config):
+            with self.reads_lock:
+                self.reads[config["configurable"]["thread_id"]] += 1
+            return get_tuple(config)
+
+        checkpointer.get_tuple = counting_get_tuple
+
+    def checkpoint_bytes(self) -> int:
+        return sum(sum(checkpoint_bytes(graph.checkpointer).values()) for graph in list(self.graphs))
+
+    def _state_bytes(self, graph, thread_id: str) -> int:
+        with self.reads_lock:
+            self.reads[thread_id] -= 1  # not part of the turn
+        latest = graph.checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+        return len(graph.checkpointer.serde.dumps_typed(latest.checkpoint)[1])
+
+    def play(self, session_id: str, choices: list[int], timings: list, samples: list) -> bool:
+        """
+        Plays one trace; returns True if the game reached its ending. Building
+        a per-session graph counts towards the first turn. At the turns in
+        turn_stats, appends (turn, {stat: value}) to samples.
+        """
+        started = time.perf_counter()
+        if self.graph_per_session:
+            graph = self._build_graph()
+            self.graphs.append(graph)
+        else:
+            graph = self.graphs[0]
+        runner = graph_runner(session_id, graph)
+        result = None
+        for turn, choice in enumerate([None, *choices], 1):
+            if result is not None and not result["options"]:
+                break
+            user_input = None if result is None else result["options"][choice % len(result["options"])]
+            sampled = turn in self.turn_stats
+            if sampled:
+                reads_before = self.reads[session_id]
+                if tracemalloc.is_tracing():
+                    heap_before = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+            if turn > 1:
+                started = time.perf_counter()
+            result = runner.run_graph_turn(user_input=user_input)
+            timings.append((turn, time.perf_counter() - started))
+            if sampled:
+                stats = {"checkpoint_reads": self.reads[session_id] - reads_before}
+                if tracemalloc.is_tracing():
+                    stats["peak_alloc_bytes"] = tracemalloc.get_traced_memory()[1] - heap_before
+                stats["checkpoint_bytes"] = self._state_bytes(graph, session_id)
+                samples.append((turn, stats))
+        return not result["options"]
+
+
+class FlaskTarget:
+    """
+    Plays sessions through the Flask app with one test client (cookie jar)
+    per session, using the streaming endpoint when STREAMING_MODE is on.
+    With duplicates > 1, every turn is submitted that many times at once
+    from clients sharing the session cookie. async_mode, if given, overrides
+    ASYNC_MODE for the app.
+    """
+
+    name = "flask"
+
+    def __init__(self, image_model: str | None = None, duplicates: int = 1, async_mode: bool | None = None):
+        import app as web
+
+        self.web = web
+        self.image_model = image_model
+        self.duplicates = duplicates
+        if async_mode is not None:
+            web.ASYNC_MODE = async_mode
+
+    def checkpoint_bytes(self) -> int:
+        return sum(checkpoint_bytes(get_graph().checkpointer).values())
+
+    def _turn(self, client, choice: int | None) -> tuple[str, ...]:
+        """
+        Plays one turn and returns the option texts offered after it.
+        """
+        button = None if choice is None else f"Option {choice + 1}"
+        if self.web.STREAMING_MODE:
+            response = client.post("/journey/stream", data={"button_name": button} if button else None)
+            # Options streamed before a "reset" event were replaced (e.g. by the ending)
+            body = response.get_data(as_text=True).rpartition("event: reset")[2]
+            options = tuple(json.loads(data)["text"] for data in re.findall(r"event: option\ndata: (.*)\n", body))
+        else:
+            if button:
+                response = client.post("/journey", data={"button_name": button})
+            else:
+                response = client.get("/journey", query_string={"image_gen": self.image_model} if self.image_model else None)
+            body = response.get_data(as_text=True)
+            options = tuple(re.findall(r'<button name="button_name"[^>]*>(.*?)</button>', body))
+        if response.status_code != 200:
+            raise RuntimeError(f"turn failed with HTTP {response.status_code}")
+        return options
+
+    def _submit(self, client, copies, choice: int | None) -> int:
+        """
+        Submits a turn from the session's client and its copies at once; all
+        of them must be offered the same options. Returns the number offered.
+        """
+        cookie = client.get_cookie("session")
+        # Before the first reply there is no session (game) to share yet
+        if not copies or cookie is None:
+            return len(self._turn(client, choice))
+        for copy in copies:
+            copy.set_cookie("session", cookie.value)
+        with ThreadPoolExecutor(max_workers=len(copies) + 1) as executor:
+            replies = set(executor.map(lambda c: self._turn(c, choice), [client, *copies]))
+        if len(replies) != 1:
+            raise RuntimeError("duplicate submissions got different replies")
+        return len(replies.pop())
+
+    def play(self, session_id: str, choices: list[int], timings: list, samples: list) -> bool:
+        """
+        Plays one trace; returns True if the game reached its ending.
+        """
+        client = self.web.app.test_client()
+        copies = [self.web.app.test_client() for _ in range(self.duplicates - 1)]
+        if self.web.STREAMING_MODE and self.image_model:
+            client.get("/journey", query_string={"image_gen": self.image_model})
+        options = None
+        for turn, choice in enumerate([None, *choices], 1):
+            if options == 0:
+                break
+            started = time.perf_counter()
+            options = self._submit(client, copies, None if choice is None else choice % options)
+            timings.append((turn, time.perf_counter() - started))
+        return options == 0
+
+
+class HttpTarget:
+    """
+    Plays sessions over HTTP against running app workers: serve.py, or
+    several single-worker servers sharing one checkpoint database (see
+    spawn_workers). Each turn of a game goes to the next worker, so every
+    turn is played by a different worker than the one before. With
+    duplicates > 1, the copies of a turn go to different workers at once.
+    Model calls are read from the workers' /metrics.
+    """
+
+    name = "http"
+
+    def __init__(self, urls: list[str], duplicates: int = 1, checkpoint_path: Path | None = None):
+        self.urls = urls
+        self.duplicates = duplicates
+        self.checkpoint_path = checkpoint_path
+
+    def checkpoint_bytes(self) -> int:
+        if self.checkpoint_path is None or not self.checkpoint_path.exists():
+            return 0
+        checkpointer = SQLiteSaver(self.checkpoint_path, pool_size=1)
+        try:
+            return sum(checkpoint_bytes(checkpointer).values())
+        finally:
+            checkpointer.close()
+
+    def narrative_calls(self) -> int:
+        calls = 0
+        for url in self.urls:
+            body = httpx.get(f"{url}/metrics").text
+            match = re.search(r'journey_span_seconds_count\{span="llm\.tier\.narrative"\} (\d+)', body)
+            calls += int(match.group(1)) if match else 0
+        return calls
+
+    def _turn(self, client, url: str, choice: int | None) -> tuple[str, ...]:
+        """
+        Plays one turn on the worker at url and returns the option texts offered after it.
+        """
+        if choice is None:
+            response = client.get(f"{url}/journey")
+        else:
+            response = client.post(f"{url}/journey", data={"button_name": f"Option {choice + 1}"})
+        if response.status_code != 200:
+            raise RuntimeError(f"turn failed with HTTP {response.status_code} on {url}")
+        return tuple(re.findall(r'<button name="button_name"[^>]*>(.*?)</button>', response.text))
+
+    def play(self, session_id: str, choices: list[int], timings: list, samples: list) -> bool:
+        """
+        Plays one trace; returns True if the game reached its ending.
+        """
+        first = int(session_id.rpartition("-")[2]) % len(self.urls)
+        workers = itertools.cycle(self.urls[first:] + self.urls[:first])
+        options = None
+        # One cookie jar for the game: cookies are not scoped by port, so
+        # every worker on the host gets the same session
+        with httpx.Client(timeout=120) as client, ThreadPoolExecutor(max_workers=self.duplicates) as executor:
+            for turn, choice in enumerate([None, *choices], 1):
+                if options == 0:
+                    break
+                if choice is not None:
+                    choice %= options
+                started = time.perf_counter()
+                copies = 1 if choice is None else self.duplicates
+                urls = [next(workers) for _ in range(copies)]
+                replies = set(executor.map(lambda url: self._turn(client, url, choice), urls))
+                if len(replies) != 1:
+                    raise RuntimeError("duplicate submissions got different replies")
+                options = len(replies.pop())
+                timings.append((turn, time.perf_counter() - started))
+        return options == 0
+
+
+@contextmanager
+def spawn_workers(count: int, port: int):
+    """
+    Starts count single-worker serve.py processes on consecutive ports from
+    port, sharing one temporary checkpoint and image job database, and
+    yields (worker urls, checkpoint database path). Stops them on exit.
+    """
+    serve = Path(__file__).resolve().parent.parent / "serve.py"
+    with tempfile.TemporaryDirectory(prefix="replay-workers-") as directory:
+        directory = Path(directory)
+        env = os.environ | {
+            "CHECKPOINTER_BACKEND": "sqlite",
+            "CHECKPOINTER_PATH": str(directory / "checkpoints.sqlite"),
+            "IMAGE_JOBS_BACKEND": "sqlite",
+            "IMAGE_JOBS_PATH": str(directory / "image_jobs.sqlite"),
+            "FLASK_SECRET_KEY": os.getenv("FLASK_SECRET_KEY") or os.urandom(16).hex(),
+        }
+        workers = []
+        try:
+            for index in range(count):
+                log = (directory / f"worker-{index}.log").open("wb")
+                command = [sys.executable, str(serve), "--workers", "1", "--host", "127.0.0.1", "--port", str(port + index)]
+                workers.append((f"http://127.0.0.1:{port + index}", subprocess.Popen(command, env=env, cwd=serve.parent, stdout=log, stderr=log), log))
+            for url, process, log in workers:
+                _wait_ready(url, process, Path(log.name))
+            yield [url for url, _, _ in workers], directory / "checkpoints.sqlite"
+        finally:
+            for _, process, log in workers:
+                process.terminate()
+                process.wait(timeout=30)
+                log.close()
+
+
+def _wait_ready(url: str, process, log: Path, timeout: float = 60):
+    """
+    Waits until the worker at url answers, or raises with the end of its log.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            httpx.get(f"{url}/metrics", timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"worker {url} did not start:\n{log.read_text(errors='replace')[-2000:]}")
+
+
+# Provider SDKs that are only imported on first use, never by "import app"
+LAZY_MODULES = ("openai", "langchain_openai", "huggingface_hub", "PIL")
+
+
+def import_time(module: str = "app", runs: int = 3) -> dict:
+    """
+    Imports module in fresh interpreters under python -X importtime, with the
+    live providers selected, and returns the fastest cumulative import time
+    in ms and the LAZY_MODULES that were imported anyway.
+    """
+    env = os.environ | {"LLM_PROVIDER": "openai", "IMAGE_PROVIDER": "live"}
+    root = Path(__file__).resolve().parent.parent
+    timings = []
+    eager = set()
+    for _ in range(runs):
+        log = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, cwd=root,
+                             capture_output=True, text=True, check=True).stderr
+        for line in log.splitlines():
+            if not line.startswith("import time:") or line.endswith("imported package"):
+                continue
+            _, cumulative, name = line.split("|")
+            name = name.strip()
+            if name == module:
+                timings.append(int(cumulative) / 1000)
+            if name.split(".")[0] in LAZY_MODULES:
+                eager.add(name.split(".")[0])
+    return {"module": module, "import_ms": round(min(timings), 1), "eager_modules": sorted(eager)}
+
+
+def run(target, traces: list[list[int]], concurrency: int, trace_memory: bool = False, turn_stats=(),
+        measure_metrics: bool = False) -> dict:
+    """
+    Replays every trace on the target and returns turns/sec, turn latency
+    percentiles and the memory retained per session, plus latency and
+    the target's per-turn samples at each turn number in turn_stats. extra_model_calls
+    counts narrative model calls beyond one per turn (and one per ending).
+    With measure_metrics, also reports the cost of metrics recording per turn.
+    """
+    timings = []
+    samples = []
+    endings = 0
+    calls = getattr(target, "narrative_calls", narrative_calls)
+    calls_before = calls()
+    spans_before = span_count()
+    incs = 0
+    if measure_metrics:
+        metrics = get_metrics()
+        inc = metrics.inc
+
+        def counting_inc(*args, **kwargs):
+            nonlocal incs
+            incs += 1
+            inc(*args, **kwargs)
+
+        metrics.inc = counting_inc
+    before = target.checkpoint_bytes()
+    if trace_memory:
+        tracemalloc.start()
+    heap_before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as executor:
+        futures = [executor.submit(target.play, f"replay-{i}", choices, timings, samples) for i, choices in enumerate(traces)]
+        failures = 0
+        for future in futures:
+            try:
+                endings += future.result()
+            except Exception:
+                failures += 1
+                logger.exception("session failed")
+    elapsed = time.perf_counter() - started
+    if measure_metrics:
+        del metrics.inc
+    spans = span_count() - spans_before
+    seconds = [s for _, s in timings]
+    report = {
+        "target": target.name,
+        "sessions": len(traces),
+        "failures": failures,
+        "turns": len(timings),
+        "seconds": round(elapsed, 3),
+        "turns_per_sec": round(len(timings) / elapsed, 2),
+        "latency_ms": {
+            f"p{q}": round(percentile(seconds, q) * 1000, 1) for q in (50, 95, 99)
+        } | {"max": round(max(seconds, default=0) * 1000, 1)},
+        "checkpoint_bytes_per_session": round(
+            (target.checkpoint_bytes() - before) / max(len(traces), 1)
+        ),
+        "extra_model_calls": calls() - calls_before - len(timings) - endings,
+    }
+    if turn_stats:
+        report["by_turn"] = {}
+        for turn in turn_stats:
+            at_turn = [s for t, s in timings if t == turn]
+            at_samples = [stats for t, stats in samples if t == turn]
+            report["by_turn"][turn] = {
+                "turns": len(at_turn),
+                "p50_ms": round(percentile(at_turn, 50) * 1000, 1),
+                "p95_ms": round(percentile(at_turn, 95) * 1000, 1),
+            }
+            for stat in at_samples[0] if at_samples else ():
+                report["by_turn"][turn][stat] = round(sum(stats[stat] for stats in at_samples) / len(at_samples), 2)
+    if measure_metrics:
+        turns = max(len(timings), 1)
+        report["metrics_overhead"] = metrics_overhead(spans / turns, incs / turns)
+    if trace_memory:
+        report["heap_bytes_per_session"] = round((tracemalloc.get_traced_memory()[0] - heap_before) / max(len(traces), 1))
+        tracemalloc.stop()
+    return report
+
+
+def failed(report: dict, duplicates: int, max_p95_ms: float | None) -> bool:
+    """
+    True for failed sessions, extra model calls with duplicates, or a p95 above max_p95_ms.
+    """
+    return bool(
+        report["failures"]
+        or (duplicates > 1 and report["extra_model_calls"])
+        or (max_p95_ms is not None and report["latency_ms"]["p95"] > max_p95_ms)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay session traces against the fake providers and report performance.")
+    parser.add_argument("--target", choices=["graph", "flask", "http"], default="graph")
+    parser.add_argument("--urls", default="", help="http target: comma-separated worker URLs to play against")
+    parser.add_argument("--spawn-workers", default="",
+                        help="http target: comma-separated worker counts, e.g. 1,2,4; starts that many serve.py workers per run")
+    parser.add_argument("--port", type=int, default=8100, help="http target: first port of spawned workers")
+    parser.add_argument("--traces", type=Path, help="JSONL traces (default: random traces)")
+    parser.add_argument("--sessions", type=int, default=20, help="random traces to generate")
+    parser.add_argument("--turns", type=int, default=10, help="choices per random trace")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-turns", type=int, default=GraphConfig().max_turns,
+                        help="graph target: player choices per game (flask target: GAME_MAX_TURNS)")
+    parser.add_argument("--summarize-every", type=int, default=GraphConfig().summarize_every,
+                        help="graph target: turns between history summaries (flask target: SUMMARIZE_EVERY)")
+    parser.add_argument("--keep-latest", type=int, default=GraphConfig().checkpoint_keep_latest,
+                        help="graph target: checkpoints kept per game, 0 keeps all (flask target: CHECKPOINT_KEEP_LATEST)")
+    parser.add_argument("--compact-every", type=int, default=GraphConfig().checkpoint_compact_every,
+                        help="graph target: new checkpoints between compactions (flask target: CHECKPOINT_COMPACT_EVERY)")
+    parser.add_argument("--dedup-messages", action=argparse.BooleanOptionalAction, default=CHECKPOINT_DEDUP_MESSAGES,
+                        help="graph target: store messages once per game (flask target: CHECKPOINT_DEDUP_MESSAGES)")
+    parser.add_argument("--checkpointer", choices=["memory", "sqlite"], default="memory",
+                        help="graph target: checkpointer backend (flask target: CHECKPOINTER_BACKEND)")
+    parser.add_argument("--graph-per-session", action="store_true",
+                        help="graph target: build a graph and checkpointer per session, as before they were shared")
+    parser.add_argument("--turn-stats", default="", help="comma-separated turn numbers to report on, e.g. 1,25,50")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions replayed at once")
+    parser.add_argument("--image-model", help="flask target: also generate images with this model")
+    parser.add_argument("--duplicates", type=int, default=1,
+                        help="flask/http target: submit every turn this many times at once and check one model call per turn")
+    parser.add_argument("--compare-async", action="store_true",
+                        help="flask target: replay the traces with ASYNC_MODE off, then on, and report both")
+    parser.add_argument("--trace-memory", action="store_true", help="measure Python heap per session (slower)")
+    parser.add_argument("--metrics-overhead", action="store_true",
+                        help="also time span/counter recording and report its cost per turn")
+    parser.add_argument("--importtime", action="store_true",
+                        help="only measure the startup import time of the app (python -X importtime)")
+    parser.add_argument("--max-import-ms", type=float,
+                        help="with --importtime, exit with status 1 above this import time")
+    parser.add_argument("--out", type=Path, help="also write the report to this JSON file")
+    parser.add_argument("--max-p95-ms", type=float, help="exit with status 1 if the p95 turn latency is above this")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.importtime:
+        report = import_time()
+        print(json.dumps(report))
+        if args.out:
+            args.out.write_text(json.dumps(report, indent=2))
+        if report["eager_modules"] or (args.max_import_ms is not None and report["import_ms"] > args.max_import_ms):
+            raise SystemExit(1)
+        return
+    traces = load_traces(args.traces) if args.traces else random_traces(args.sessions, args.turns, args.seed)
+    turn_stats = [int(turn) for turn in args.turn_stats.split(",") if turn]
+    if args.target == "http" and args.spawn_workers:
+        report = {}
+        for count in [int(count) for count in args.spawn_workers.split(",")]:
+            with spawn_workers(count, args.port) as (urls, checkpoint_path):
+                target = HttpTarget(urls, args.duplicates, checkpoint_path)
+                report[f"workers_{count}"] = run(target, traces, args.concurrency)
+        runs = list(report.values())
+    elif args.target == "http":
+        report = run(HttpTarget(args.urls.split(","), args.duplicates), traces, args.concurrency)
+        runs = [report]
+    elif args.target == "flask" and args.compare_async:
+        report = {
+            mode: run(FlaskTarget(args.image_model, args.duplicates, async_mode), traces, args.concurrency,
+                      args.trace_memory, turn_stats, args.metrics_overhead)
+            for mode, async_mode in (("sync", False), ("async", True))
+        }
+        runs = list(report.values())
+    else:
+        if args.target == "flask":
+            target = FlaskTarget(args.image_model, args.duplicates)
+        else:
+            graph_config = GraphConfig(max_turns=args.max_turns, summarize_every=args.summarize_every,
+                                       checkpoint_keep_latest=args.keep_latest, checkpoint_compact_every=args.compact_every)
+            target = GraphTarget(graph_config, turn_stats, args.dedup_messages, args.graph_per_session, args.checkpointer)
+        report = run(target, traces, args.concurrency, args.trace_memory, turn_stats, args.metrics_overhead)
+        runs = [report]
+    print(json.dumps(report))
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+    if any(failed(result, args.duplicates, args.max_p95_ms) for result in runs):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock, Thread
+
+# Bounds for the per-game object stores (see .env.example)
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+
+class SessionRegistry:
+    """
+    Bounded, thread-safe store of per-game objects keyed by game_id.
+    Entries idle for longer than the TTL are dropped by a background sweeper,
+    and the least recently used entry is evicted when the store is full.
+    An on_evict callback lets callers release resources tied to the game.
+    """
+
+    def __init__(self, factory, ttl: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL, on_evict=None, clock=time.monotonic):
+        """
+        factory(key) builds a missing entry; on_evict(key, value, idle) is
+        called outside the lock for every entry removed from the store.
+        clock can be replaced to drive idle times in tests.
+        """
+        self.factory = factory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (value, last access time)
+        self.lock = Lock()
+        self.evictions = 0
+        self.sweeper = None
+
+    def get(self, key):
+        """
+        Returns the entry for key, creating it if needed, and marks it as recently used.
+        """
+        self._ensure_sweeper()
+        evicted = []
+        with self.lock:
+            if key in self.entries:
+                value = self.entries[key][0]
+                self.entries.move_to_end(key)
+            else:
+                value = self.factory(key)
+                while len(self.entries) >= self.max_entries:
+                    old_key, (old_value, _) = self.entries.popitem(last=False)
+                    evicted.append((old_key, old_value))
+                    self.evictions += 1
+            self.entries[key] = (value, self.clock())
+        for old_key, old_value in evicted:
+            self._evicted(old_key, old_value, idle=False)
+        return value
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def pop(self, key):
+        """
+        Removes an entry (e.g. on reset), running the eviction callback.
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        if entry is not None:
+            self._evicted(key, entry[0], idle=False)
+
+    def sweep(self):
+        """
+        Evicts every entry that has been idle for longer than the TTL.
+        """
+        deadline = self.clock() - self.ttl
+        expired = []
+        with self.lock:
+            # Entries are kept in access order, so idle ones are at the front
+            for key, (value, last_access) in self.entries.items():
+                if last_access > deadline:
+                    break
+                expired.append((key, value))
+            for key, _ in expired:
+                del self.entries[key]
+            self.evictions += len(expired)
+        for key, value in expired:
+            self._evicted(key, value, idle=True)
+
+    def _evicted(self, key, value, idle):
+        if self.on_evict is not None:
+            self.on_evict(key, value, idle)
+
+    def _ensure_sweeper(self):
+        """
+        Starts the background sweeper (again after a fork, where threads do not survive).
+        """
+        if self.sweeper is not None and self.sweeper.is_alive():
+            return
+        with self.lock:
+            if self.sweeper is None or not self.sweeper.is_alive():
+                self.sweeper = Thread(target=self._sweep_forever, name="session-sweeper", daemon=True)
+                self.sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries.keys())
+
+    def stats(self) -> dict:
+        """
+        Returns live-session and eviction gauges.
+        """
+        with self.lock:
+            return {"live_sessions": len(self.entries), "evictions": self.evictions}
@@ -0,0 +1,192 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+
+from langchain_core.messages import AIMessage
+
+from graph.checkpointer import copy_checkpoint
+from services.graph_runner import graph_runner
+from services.turn_scheduler import get_turn_scheduler
+
+# Opt-in speculative pre-generation of the next scenario for every option
+SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "0") == "1"
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "4"))
+SPECULATIVE_TOKEN_BUDGET = int(os.getenv("SPECULATIVE_TOKEN_BUDGET", "20000"))
+
+_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculation")
+_lock = Lock()
+# thread_id -> {"branches": {option text: (fork thread_id, future)}, "tokens": int}
+_sessions = {}
+_stats = {"hits": 0, "misses": 0, "wasted_tokens": 0, "clicks": 0, "click_latency_total": 0.0}
+
+
+def _thread(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _branch_tokens(graph, fork_thread_id, known_ids):
+    """
+    Sums the model tokens spent on the AI messages a branch added after the fork.
+    """
+    state = graph.get_state(_thread(fork_thread_id))
+    return sum(
+        (msg.usage_metadata or {}).get("total_tokens", 0)
+        for msg in state.values.get("messages", [])
+        if isinstance(msg, AIMessage) and msg.id not in known_ids
+    )
+
+
+def _run_branch(runner, fork_thread_id, option_text):
+    """
+    Forks the game's current checkpoint into its own thread and plays the
+    given option there, in a background slot of the turn scheduler (raising
+    TurnBusy when player turns need the slots). Returns (turn result, tokens
+    spent on the branch).
+    """
+    with get_turn_scheduler().background_slot():
+        fork = copy_checkpoint(runner.graph, runner.thread_id, fork_thread_id)
+        if fork is None:
+            raise LookupError(f"game {runner.thread_id} has no checkpoint to fork")
+        # Same graph as the game, so the branch uses its config and checkpointer
+        result = graph_runner(fork_thread_id, runner.graph).run_graph_turn(user_input=option_text)
+    known_ids = {msg.id for msg in fork.checkpoint["channel_values"].get("messages", [])}
+    return result, _branch_tokens(runner.graph, fork_thread_id, known_ids)
+
+
+def _discard_branch(graph, thread_id, fork_thread_id, future):
+    """
+    Done-callback for an unused branch: books its tokens as wasted and deletes its forked thread.
+    """
+    wasted = 0
+    if not future.cancelled() and future.exception() is None:
+        wasted = future.result()[1]
+    graph.checkpointer.delete_thread(fork_thread_id)
+    _charge(thread_id, 0, wasted)
+
+
+def _drop_branches(graph, thread_id, branches):
+    """
+    Cancels queued branches and lets running ones finish in the background
+    before they are discarded, so the player's request never waits on them.
+    """
+    for fork_thread_id, future in branches.values():
+        future.cancel()
+        future.add_done_callback(partial(_discard_branch, graph, thread_id, fork_thread_id))
+
+
+def start_speculation(runner, options):
+    """
+    Pre-generates the next turn for each option in the background, as long
+    as the session is still within its speculative token budget.
+    """
+    discard_speculation(runner)
+    with _lock:
+        session = _sessions.setdefault(runner.thread_id, {"branches": {}, "tokens": 0})
+        if session["tokens"] >= SPECULATIVE_TOKEN_BUDGET:
+            return
+        for option_text in options:
+            # Unique per branch, so a discarded branch still running from an
+            # earlier turn never deletes or overwrites this one's thread
+            fork_thread_id = f"{runner.thread_id}:spec:{uuid.uuid4().hex}"
+            session["branches"][option_text] = (
+                fork_thread_id,
+                _executor.submit(_run_branch, runner, fork_thread_id, option_text),
+            )
+
+
+def _pop_branches(thread_id):
+    """
+    Detaches and returns the pending branches of a game.
+    """
+    with _lock:
+        session = _sessions.get(thread_id)
+        if session is None:
+            return {}
+        branches, session["branches"] = session["branches"], {}
+        return branches
+
+
+def _charge(thread_id, tokens, wasted):
+    """
+    Books speculative token spend against the session budget and the global stats.
+    """
+    with _lock:
+        if thread_id in _sessions:
+            _sessions[thread_id]["tokens"] += tokens + wasted
+        _stats["wasted_tokens"] += wasted
+
+
+def take_speculation(runner, option_text):
+    """
+    Commits the pre-generated branch for the chosen option into the game's
+    thread and returns its turn result, or None on a miss (no branch, branch
+    not started yet, or failed, or turned away by the scheduler), after which
+    the caller plays the turn normally. Other branches are discarded.
+    """
+    graph = runner.graph
+    branches = _pop_branches(runner.thread_id)
+    branch = branches.pop(option_text, None)
+
+    result, tokens = None, 0
+    if branch is not None:
+        fork_thread_id, future = branch
+        if not future.cancel():
+            try:
+                result, tokens = future.result()
+            except Exception:
+                result = None
+
+        # The branch's final checkpoint becomes the game's latest checkpoint;
+        # a branch whose thread is already gone is a miss
+        if result is not None and copy_checkpoint(graph, fork_thread_id, runner.thread_id) is None:
+            result = None
+        graph.checkpointer.delete_thread(fork_thread_id)
+
+    _charge(runner.thread_id, tokens, 0)
+    _drop_branches(graph, runner.thread_id, branches)
+    with _lock:
+        _stats["hits" if result is not None else "misses"] += 1
+    return result
+
+
+def record_click_latency(seconds):
+    """
+    Records the click-to-render latency of a turn that followed a player choice.
+    """
+    with _lock:
+        _stats["clicks"] += 1
+        _stats["click_latency_total"] += seconds
+
+
+def discard_speculation(runner):
+    """
+    Drops all pending branches for a game (e.g. on reset or eviction).
+    """
+    _drop_branches(runner.graph, runner.thread_id, _pop_branches(runner.thread_id))
+
+
+def forget_session(runner):
+    """
+    Discards pending branches and the token budget bookkeeping for a finished game.
+    """
+    discard_speculation(runner)
+    with _lock:
+        _sessions.pop(runner.thread_id, None)
+
+
+def speculation_stats():
+    """
+    Returns hit rate, wasted tokens and mean click-to-render latency.
+    """
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        "wasted_tokens": stats["wasted_tokens"],
+        "mean_click_latency": stats["click_latency_total"] / stats["clicks"] if stats["clicks"] else 0.0,
+    }
@@ -0,0 +1,160 @@
+import os
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from threading import Event, Lock
+
+# Admission of player turns (see .env.example): turns running at once across
+# all games, turns allowed to wait for a slot, and the longest wait before a
+# turn is turned away as busy
+TURN_CONCURRENCY = int(os.getenv("TURN_CONCURRENCY", "32"))
+TURN_QUEUE_SIZE = int(os.getenv("TURN_QUEUE_SIZE", "64"))
+TURN_QUEUE_TIMEOUT = float(os.getenv("TURN_QUEUE_TIMEOUT", "30"))
+
+
+class TurnBusy(RuntimeError):
+    """
+    Raised when a turn cannot be admitted; served as HTTP 429 with Retry-After.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = Event()
+        self.granted = False
+
+
+class TurnScheduler:
+    """
+    Bounded work queue in front of the graph: at most `concurrency` turns run
+    at once, up to `queue_size` more wait for a slot, and anything beyond
+    that is rejected at once with TurnBusy instead of piling up on the
+    provider. Waiting turns are queued per session and freed slots go
+    round-robin across sessions, so one busy session cannot starve the rest.
+    Background work (speculative branches) takes a slot only when one is free
+    and no turn waits, and never queues, so player turns always come first.
+    """
+
+    def __init__(self, concurrency: int = TURN_CONCURRENCY, queue_size: int = TURN_QUEUE_SIZE,
+                 timeout: float = TURN_QUEUE_TIMEOUT):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.lock = Lock()
+        self.running = 0
+        self.queued = 0
+        self.waiting = OrderedDict()  # session -> deque of waiters, in round-robin order
+        self.counters = {"admitted": 0, "waited": 0, "rejected": 0, "timeouts": 0,
+                         "background_admitted": 0, "background_rejected": 0}
+
+    def _enter(self, session: str) -> _Waiter | None:
+        """
+        Takes a free slot (returns None) or queues a waiter for the session.
+        """
+        with self.lock:
+            if self.running < self.concurrency and not self.queued:
+                self.running += 1
+                self.counters["admitted"] += 1
+                return None
+            if self.queued >= self.queue_size:
+                self.counters["rejected"] += 1
+                raise TurnBusy("turn queue is full")
+            waiter = _Waiter()
+            self.waiting.setdefault(session, deque()).append(waiter)
+            self.queued += 1
+            self.counters["waited"] += 1
+            return waiter
+
+    def _wait(self, session: str, waiter: _Waiter):
+        """
+        Blocks until the waiter is granted a slot, or withdraws it on timeout.
+        """
+        if waiter.event.wait(self.timeout):
+            return
+        with self.lock:
+            if waiter.granted:
+                return
+            queue = self.waiting[session]
+            queue.remove(waiter)
+            if not queue:
+                del self.waiting[session]
+            self.queued -= 1
+            self.counters["timeouts"] += 1
+        raise TurnBusy("timed out waiting for a turn slot", retry_after=self.timeout)
+
+    def _release(self):
+        """
+        Hands the freed slot to the next session in round-robin order, or frees it.
+        """
+        with self.lock:
+            if not self.waiting:
+                self.running -= 1
+                return
+            session, queue = next(iter(self.waiting.items()))
+            waiter = queue.popleft()
+            if queue:
+                self.waiting.move_to_end(session)
+            else:
+                del self.waiting[session]
+            self.queued -= 1
+            self.counters["admitted"] += 1
+            waiter.granted = True
+        waiter.event.set()
+
+    @contextmanager
+    def slot(self, session: str):
+        """
+        Runs the enclosed turn in a slot, waiting in the session's queue if
+        all slots are taken. Raises TurnBusy when the queue is full or the
+        wait exceeds the timeout.
+        """
+        waiter = self._enter(session)
+        if waiter is not None:
+            self._wait(session, waiter)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def background_slot(self):
+        """
+        Runs the enclosed background work in a free slot, or raises TurnBusy
+        at once when all slots are taken or a player turn is waiting.
+        """
+        with self.lock:
+            if self.running >= self.concurrency or self.queued:
+                self.counters["background_rejected"] += 1
+                raise TurnBusy("no free turn slot for background work")
+            self.running += 1
+            self.counters["background_admitted"] += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        """
+        Returns the running/queued gauges and the admission counters.
+        """
+        with self.lock:
+            return {"running": self.running, "queued": self.queued, "sessions_waiting": len(self.waiting), **self.counters}
+
+
+_turn_scheduler = None
+_turn_scheduler_lock = Lock()
+
+
+def get_turn_scheduler() -> TurnScheduler:
+    """
+    Returns the process-wide turn scheduler, creating it on first use.
+    """
+    global _turn_scheduler
+    if _turn_scheduler is None:
+        with _turn_scheduler_lock:
+            if _turn_scheduler is None:
+                _turn_scheduler = TurnScheduler()
+    return _turn_scheduler
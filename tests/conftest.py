@@ -0,0 +1,12 @@
+"""
+Tests run against the fake LLM and image providers, without delays or rate
+limits. Set before any test module imports the graph or the app.
+"""
+import os
+
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["IMAGE_PROVIDER"] = "fake"
+os.environ["FAKE_LLM_LATENCY_MS"] = "0"
+os.environ["FAKE_LLM_TOKENS_PER_SEC"] = "1000000"
+os.environ["PROVIDER_RATE_LIMIT"] = "100000"
+os.environ["PROVIDER_BURST"] = "100000"
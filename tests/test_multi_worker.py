@@ -0,0 +1,27 @@
+"""
+Two serve.py workers sharing one SQLite checkpoint database, with no sticky
+routing: every turn of a game goes to the other worker, and duplicate
+submissions reach both workers at once.
+"""
+import socket
+
+from services.replay_bench import HttpTarget, random_traces, run, spawn_workers
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_games_continue_on_another_worker_and_duplicates_run_once(monkeypatch):
+    # Slow enough that both copies of a turn overlap
+    monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "50")
+    traces = random_traces(sessions=4, turns=3, seed=0)
+    with spawn_workers(2, free_port()) as (urls, checkpoint_path):
+        report = run(HttpTarget(urls, duplicates=2, checkpoint_path=checkpoint_path), traces, concurrency=4)
+
+    assert report["failures"] == 0
+    assert report["turns"] == 4 * (1 + 3)
+    assert report["extra_model_calls"] == 0
+    assert report["checkpoint_bytes_per_session"] > 0
@@ -0,0 +1,72 @@
+"""
+Token accounting for the bounded story prompt: prompt size at 5, 20 and 100
+turns, with the summarize node's decisions applied as the game goes on.
+"""
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from graph.config import GraphConfig
+from graph.nodes import continuation_prompt, messages_to_summarize, opening_prompt
+
+SCENE = "The lantern flickers as the bridge sways over the chasm. " * 12
+SUMMARY = "The hero crossed the chasm and met the ferryman. " * 6
+
+
+def play(turns: int, graph_config: GraphConfig):
+    """
+    Returns the prompt token counts of every turn and the number of summary
+    calls, folding older messages into a fixed-size summary when due.
+    """
+    state = {"messages": [opening_prompt(graph_config.max_turns), AIMessage(content=SCENE)], "summary": None}
+    sizes = []
+    summaries = 0
+    for turn in range(1, turns + 1):
+        state["messages"].append(HumanMessage(content=f"Option {turn % 3 + 1}"))
+        state["response_count"] = turn
+        older = messages_to_summarize(state, graph_config)
+        if older:
+            summaries += 1
+            state["messages"] = [state["messages"][0], *state["messages"][1 + len(older):]]
+            state["summary"] = SUMMARY
+        sizes.append(count_tokens_approximately(continuation_prompt(state, graph_config)))
+        state["messages"].append(AIMessage(content=SCENE))
+    return sizes, summaries
+
+
+@pytest.mark.parametrize("turns", [5, 20, 100])
+def test_prompt_stays_within_budget(turns):
+    graph_config = GraphConfig(max_turns=turns, summarize_every=1, history_window=4, history_token_budget=2000)
+    fixed = count_tokens_approximately([opening_prompt(turns)]) + count_tokens_approximately([AIMessage(content=SUMMARY)])
+
+    sizes, _ = play(turns, graph_config)
+
+    # System prompt + summary + budgeted history + the player's choice
+    assert max(sizes) <= fixed + graph_config.history_token_budget + 50
+
+
+def test_prompt_size_flat_over_long_games():
+    graph_config = GraphConfig(max_turns=100, summarize_every=1, history_window=4, history_token_budget=2000)
+
+    sizes, summaries = play(100, graph_config)
+
+    assert summaries > 0
+    assert max(sizes[50:]) <= max(sizes[:20])
+
+
+def test_no_summary_call_under_budget():
+    graph_config = GraphConfig(max_turns=5, summarize_every=1, history_window=4, history_token_budget=2000)
+
+    _, summaries = play(5, graph_config)
+
+    assert summaries == 0
+
+
+def test_summary_only_checked_at_cadence():
+    graph_config = GraphConfig(max_turns=20, summarize_every=5, history_window=2, history_token_budget=200)
+
+    history = [AIMessage(content=SCENE), HumanMessage(content="Option 1")] * 3
+    state = {"messages": [opening_prompt(20), *history], "summary": None}
+
+    assert messages_to_summarize(state | {"response_count": 4}, graph_config) == []
+    assert len(messages_to_summarize(state | {"response_count": 5}, graph_config)) == len(history) - 2
@@ -0,0 +1,173 @@
+"""
+Deterministic gateway behaviour against a scripted fake provider: retries of
+429s and timeouts, the circuit breaker, backoff, and image cache hits that
+never reach the gateway, and tier latencies that leave out rate-limit waits.
+The clock and rng are injected, so nothing sleeps.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from utils import ImageProviderRegistry as registry_module
+from utils.ImageCacheUtils import ImageCacheUtils
+from utils.ImageProviderRegistry import ImageProviderRegistry
+from utils.ProviderGateway import ProviderGateway, ProviderUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FakeProvider:
+    """
+    Replays a script of results; exceptions in it are raised.
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        outcome = self.script.pop(0) if self.script else "image"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_gateway(clock, **kwargs):
+    # rng() == 0 makes every jittered backoff zero; the burst covers all calls
+    return ProviderGateway("fake", rate=1, burst=100, clock=clock, rng=lambda: 0.0, **kwargs)
+
+
+def test_throttled_calls_are_retried():
+    gateway = make_gateway(FakeClock(), max_retries=4)
+    provider = FakeProvider(HTTPError(429), HTTPError(429), "image")
+
+    assert gateway.call(None, provider) == "image"
+    assert provider.calls == 3
+    assert gateway.stats() == {"calls": 1, "retries": 2, "coalesced": 0, "rejected": 0, "failures": 2, "breaker": "closed"}
+
+
+def test_timeouts_give_up_after_max_retries():
+    gateway = make_gateway(FakeClock(), max_retries=2, breaker_threshold=10)
+    provider = FakeProvider(TimeoutError(), TimeoutError(), TimeoutError(), "image")
+
+    with pytest.raises(TimeoutError):
+        gateway.call(None, provider)
+    assert provider.calls == 3
+
+
+def test_client_errors_are_not_retried():
+    gateway = make_gateway(FakeClock(), max_retries=4)
+    provider = FakeProvider(HTTPError(400))
+
+    with pytest.raises(HTTPError):
+        gateway.call(None, provider)
+    assert provider.calls == 1
+    assert gateway.stats()["failures"] == 0
+
+
+def test_breaker_opens_and_lets_one_trial_through_after_reset():
+    clock = FakeClock()
+    gateway = make_gateway(clock, max_retries=0, breaker_threshold=3, breaker_reset=30)
+    provider = FakeProvider(HTTPError(503), HTTPError(503), HTTPError(503), "image")
+
+    for _ in range(3):
+        with pytest.raises(HTTPError):
+            gateway.call(None, provider)
+    assert gateway.stats()["breaker"] == "open"
+
+    clock.now += 29
+    with pytest.raises(ProviderUnavailable):
+        gateway.call(None, provider)
+    assert provider.calls == 3
+
+    clock.now += 1
+    assert gateway.call(None, provider) == "image"
+    assert gateway.stats()["breaker"] == "closed"
+    assert gateway.stats()["rejected"] == 1
+
+
+def test_backoff_is_jittered_and_honours_retry_after():
+    gateway = ProviderGateway("fake", backoff_base=0.5, backoff_max=20, clock=FakeClock(), rng=lambda: 0.5)
+
+    assert gateway._backoff(0, HTTPError(503)) == 0.25
+    assert gateway._backoff(3, HTTPError(503)) == 2.0
+    assert gateway._backoff(10, HTTPError(503)) == 10.0
+    assert gateway._backoff(0, HTTPError(429, retry_after=7)) == 7.0
+    assert gateway._backoff(0, HTTPError(429, retry_after=60)) == 20.0
+
+
+def test_rate_limit_queues_callers_on_the_clock():
+    clock = FakeClock()
+    gateway = ProviderGateway("fake", rate=2, burst=2, clock=clock, rng=lambda: 0.0)
+
+    assert [gateway._reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now += 1.5
+    assert [gateway._reserve(), gateway._reserve()] == [0.0, 0.5]
+
+
+def test_image_cache_hits_bypass_the_gateway(tmp_path, monkeypatch):
+    cache = ImageCacheUtils(tmp_path)
+    monkeypatch.setattr(registry_module, "get_image_cache", lambda: cache)
+    backend = SimpleNamespace(IMAGE_SIZE=(64, 64), get_img=FakeProvider(HTTPError(429), "/images/new.png"))
+    registry = ImageProviderRegistry()
+    registry.backends["fake"] = backend
+    registry.semaphores["fake"] = registry_module.BoundedSemaphore(1)
+    gateway = registry.gateways["fake"] = ProviderGateway("fake", rate=1000, burst=1, breaker_threshold=2,
+                                                          clock=FakeClock(), rng=lambda: 0.0)
+
+    # A cached image with its variants, as ImageCacheUtils.put leaves it
+    key = cache.key("fake", "a cached scene", backend.IMAGE_SIZE)
+    for name in (f"{key}{cache.EXTENSION}", *(cache._variant_name(key, w) for w in cache.VARIANT_WIDTHS)):
+        (tmp_path / name).write_bytes(b"")
+
+    for _ in range(5):
+        assert registry.get_img("fake", "a cached scene") == cache.url(key)
+    assert backend.get_img.calls == 0
+    assert gateway.stats()["calls"] == 0
+    assert gateway.tokens == 1
+
+    # A miss still goes through the gateway (and its retries)
+    assert registry.get_img("fake", "a new scene") == "/images/new.png"
+    assert backend.get_img.calls == 2
+    assert gateway.stats()["calls"] == 1
+
+
+def test_tier_latency_excludes_rate_limit_waits(monkeypatch):
+    from graph import llm
+    from langchain_core.messages import HumanMessage
+    from utils import ProviderGateway as gateway_module
+    from utils.Metrics import get_metrics
+
+    clock = FakeClock()
+
+    def sleep(seconds):
+        clock.now += seconds
+
+    monkeypatch.setattr(gateway_module, "time", SimpleNamespace(sleep=sleep))
+    monkeypatch.setattr(llm, "time", SimpleNamespace(perf_counter=clock, monotonic=clock))
+    monkeypatch.setattr(llm, "llm_gateway", ProviderGateway("fake", rate=2, burst=1, clock=clock, rng=lambda: 0.0))
+    monkeypatch.setitem(llm._latencies, "summary", llm.deque())
+    queue = get_metrics().spans.get("llm.queue")
+    queued_before = queue.sum if queue else 0.0
+
+    for _ in range(3):
+        llm.invoke_model("summary", [HumanMessage(content="Summarize the story so far.")])
+
+    # The second and third calls wait 0.5 s each for a token, outside the provider call
+    assert [seconds for _, seconds in llm._latencies["summary"]] == [0.0, 0.0, 0.0]
+    assert get_metrics().spans["llm.queue"].sum - queued_before == pytest.approx(1.0)
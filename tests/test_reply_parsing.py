@@ -0,0 +1,112 @@
+"""
+Malformed-reply corpus for StreamingReplyParser and story_update: truncated
+and invalid JSON, wrong types, extra or missing options and odd text
+formats. Every reply must parse the same however it is split into tokens,
+and never raise.
+"""
+import random
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from graph.nodes import story_update
+from utils.StreamingReplyParser import StreamingReplyParser
+
+CORPUS = [
+    '',
+    '   ',
+    '\n\n',
+    '{',
+    '}',
+    '{}',
+    '[]',
+    'null',
+    '"just a string"',
+    '{"narrative": ',
+    '{"narrative": "A dark',
+    '{"narrative": "Esc \\',
+    '{"narrative": "Esc \\u00e9 done", "options": ["a", "b", "c"]}',
+    '{"narrative": "Tab\\t and \\"quotes\\"", "options": ["x"',
+    '{"narrative": 42, "options": "abc"}',
+    '{"narrative": null, "options": [1, null, "ok", {"a": 1}]}',
+    '{"narrative": "Four", "options": ["a", "b", "c", "d"]}',
+    '{"options": ["a", "b", "c"], "narrative": "Order swapped"}',
+    '{"narrative": "x", "options": ["a", "b", "c"]} trailing',
+    '{"narrative": "Nested {\\"json\\"}", "options": [["a"], "b"]}',
+    '{"narrative": "Broken", "options": ["a", "b", "c"',
+    'Plain text scene without options',
+    'Scene.\nOption 1: Go\nOption 2: Stay\nOption 3: Run',
+    'Scene.\nOption 1: Go Option 2: Stay\nOption 3: Run\nOption 4: Extra',
+    'Scene mentions Option 1 in passing.\nOption 1: a\nOption 2: b',
+    'Option 1:\nOption 2:\nOption 3:',
+    'Option 1: only one',
+    'Ünïcödé scène 🐉\nOption 1: 🗡️\nOption 2: 🛡️\nOption 3: 🏃',
+    'Scene\r\nOption 1: a\r\nOption 2: b\r\nOption 3: c',
+    '  {"narrative": "Leading space", "options": ["a","b","c"]}',
+    '```json\n{"narrative": "fenced", "options": ["a","b","c"]}\n```',
+    '{"narrative": "Option 1: inside json", "options": ["a","b","c"]}',
+    'Option 9: nine\nOption 0: zero',
+    '{"narrative": "\\ud83d", "options": []}',
+]
+
+
+def parse(text: str, chunk_sizes):
+    """
+    Feeds text in chunks of the given sizes; returns the parser and the
+    narrative and options it released along the way.
+    """
+    parser = StreamingReplyParser()
+    released, options = "", []
+    start = 0
+    for size in chunk_sizes:
+        if start >= len(text):
+            break
+        delta, new_options = parser.feed(text[start:start + size])
+        released += delta
+        options += new_options
+        start += size
+    delta, new_options = parser.finish()
+    return parser, released + delta, options + new_options
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_parse_does_not_depend_on_token_boundaries(text):
+    whole, _, _ = parse(text, [len(text)])
+
+    for seed in range(25):
+        rng = random.Random(seed)
+        parser, released, options = parse(text, [rng.randint(1, 5) for _ in range(len(text))])
+
+        assert parser.narrative == whole.narrative
+        assert parser.options == whole.options
+        # What was streamed out adds up to the final reply
+        assert released == parser.narrative
+        assert options == parser.options
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_parse_yields_at_most_three_text_options(text):
+    parser, _, _ = parse(text, [len(text)])
+
+    assert isinstance(parser.narrative, str)
+    assert parser.narrative_complete
+    assert len(parser.options) <= StreamingReplyParser.MAX_OPTIONS
+    assert all(isinstance(option, str) for option in parser.options)
+
+
+@pytest.mark.parametrize("content", [*CORPUS, ["not", "a", "string"], [{"type": "text", "text": "blocks"}]])
+def test_story_update_falls_back_on_unparsed_replies(content):
+    update = story_update({"raw": AIMessage(content=content, id="reply"), "parsed": None})
+
+    message, = update["messages"]
+    assert isinstance(message.content, str)
+    assert message.id == "reply"
+    assert len(update["options"]) <= StreamingReplyParser.MAX_OPTIONS
+    assert all(isinstance(option, str) for option in update["options"])
+
+
+def test_option_marker_needs_its_colon():
+    parser, _, _ = parse("Scene mentions Option 1 in passing.\nOption 1: a\nOption 2: b", [3] * 30)
+
+    assert parser.narrative == "Scene mentions Option 1 in passing.\n"
+    assert parser.options == ["a", "b"]
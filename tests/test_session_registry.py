@@ -0,0 +1,146 @@
+"""
+Soak tests for SessionRegistry: sustained traffic over many games with an
+injected clock, checking TTL sweeps, the LRU cap and the retained memory,
+and 100k short games released through the app's release_game into an
+in-memory checkpointer.
+"""
+import random
+import tracemalloc
+from collections import Counter
+
+from services.session_registry import SessionRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_registry(clock, on_evict, ttl=600.0, max_entries=500):
+    return SessionRegistry(
+        lambda key: bytearray(1024),
+        ttl=ttl,
+        max_entries=max_entries,
+        sweep_interval=3600,  # the test sweeps by hand
+        on_evict=on_evict,
+        clock=clock,
+    )
+
+
+def test_idle_sessions_are_swept_after_ttl():
+    clock = FakeClock()
+    evicted = []
+    registry = make_registry(clock, lambda key, value, idle: evicted.append((key, idle)), ttl=600)
+
+    registry.get("idle")
+    clock.now += 300
+    registry.get("active")
+    clock.now += 400
+    registry.sweep()
+
+    assert registry.keys() == ["active"]
+    assert evicted == [("idle", True)]
+
+
+def test_least_recently_used_session_is_evicted_when_full():
+    clock = FakeClock()
+    evicted = []
+    registry = make_registry(clock, lambda key, value, idle: evicted.append((key, idle)), max_entries=3)
+
+    for key in ("a", "b", "c"):
+        registry.get(key)
+    registry.get("a")
+    registry.get("d")
+
+    assert registry.keys() == ["c", "a", "d"]
+    assert evicted == [("b", False)]
+
+
+def test_soak_keeps_sessions_and_memory_bounded():
+    clock = FakeClock()
+    evicted = Counter()  # idle -> evictions; a list of keys would itself grow
+    registry = make_registry(clock, lambda key, value, idle: evicted.update([idle]), ttl=600, max_entries=500)
+    rng = random.Random(0)
+    created = 0
+
+    def traffic(requests):
+        # A stream of new players mixed with returning ones, one request per second
+        nonlocal created
+        for _ in range(requests):
+            clock.now += 1
+            if rng.random() < 0.3 or not created:
+                created += 1
+                registry.get(f"game-{created}")
+            else:
+                registry.get(f"game-{rng.randint(max(1, created - 50), created)}")
+            if clock.now % 60 == 0:
+                registry.sweep()
+            assert len(registry.keys()) <= registry.max_entries
+
+    tracemalloc.start()
+    traffic(20_000)
+    warm = tracemalloc.get_traced_memory()[0]
+    traffic(50_000)
+    retained = tracemalloc.get_traced_memory()[0] - warm
+    tracemalloc.stop()
+
+    # Every game that left the store went through the callback once
+    assert evicted.total() + len(registry.keys()) == created
+    assert evicted.total() == registry.stats()["evictions"]
+    # New players arrive ~every 3 s, so the TTL (not the cap) bounds the store
+    assert evicted[True] > 0
+    assert len(registry.keys()) <= 600 / 3 * 1.5
+    # 50k more requests on top of a warm store retain no more than a few entries' worth
+    assert retained < 64 * 1024
+
+
+def test_soak_releases_the_checkpoints_of_100k_games():
+    # Imported here so the registry tests above do not need the app
+    import app as web
+    from graph.checkpointer import CompactingMemorySaver, checkpoint_bytes, copy_checkpoint
+    from graph.graph_builder import build_graph
+    from services.graph_runner import graph_runner
+
+    graph = build_graph(CompactingMemorySaver())
+    graph_runner("opening", graph).run_graph_turn()
+    checkpointer = graph.checkpointer
+    clock = FakeClock()
+    evicted = Counter()
+
+    def release_game(game_id, runner, idle):
+        evicted.update([idle])
+        web.release_game(game_id, runner, idle)
+
+    registry = SessionRegistry(lambda game_id: graph_runner(game_id, graph), ttl=80, max_entries=100,
+                               sweep_interval=3600, on_evict=release_game, clock=clock)
+
+    def games(first, count):
+        # Short sessions: every game plays the opening (a copy of it) and leaves
+        for n in range(first, first + count):
+            clock.now += 1
+            game_id = f"game-{n}"
+            registry.get(game_id)
+            web.api_store.get(game_id)
+            copy_checkpoint(graph, "opening", game_id)
+            if n % 100 == 0:
+                registry.sweep()
+
+    def retained():
+        threads = {key[0] for key in checkpointer.blobs} | {key[0] for key in checkpointer.writes}
+        return len(checkpointer.storage), len(threads), sum(checkpoint_bytes(checkpointer).values())
+
+    games(0, 10_000)
+    warm = retained()
+    games(10_000, 90_000)
+
+    # Both the TTL sweep and the LRU cap released games, through release_game
+    assert evicted[True] > 0 and evicted[False] > 0
+    assert evicted.total() + len(registry.keys()) == 100_000
+    # Checkpointer storage holds the live games only, as it did after warm-up
+    live = len(registry.keys()) + 1  # plus the opening template
+    assert retained()[0] == live and retained()[1] <= live
+    assert retained()[2] <= warm[2] * 1.05
+    assert len(web.api_store.keys()) <= registry.max_entries
@@ -0,0 +1,37 @@
+"""
+Speculative branches across consecutive turns: a branch discarded while still
+running must not touch the next turn's branches, and every committed hit
+must advance the game.
+"""
+import time
+
+from graph.config import GraphConfig
+from graph.fake_llm import FakeStoryModel
+from graph.graph_builder import build_graph
+from graph.checkpointer import CompactingMemorySaver, copy_checkpoint
+from services.graph_runner import graph_runner
+from services.speculation import start_speculation, take_speculation
+
+
+def test_every_taken_turn_advances_the_game(monkeypatch):
+    # Slow enough that discarded branches are still running at the next turn
+    reply = FakeStoryModel._reply
+    monkeypatch.setattr(FakeStoryModel, "_reply", lambda self, messages: (0.005, *reply(self, messages)[1:]))
+    graph = build_graph(CompactingMemorySaver(), GraphConfig(max_turns=6))
+    for game in range(20):
+        runner = graph_runner(f"game-{game}", graph)
+        runner.run_graph_turn()
+        for turn in range(1, 4):
+            options = runner.current_turn()["options"]
+            start_speculation(runner, options)
+            time.sleep(0.001 * (game % 3))
+            choice = options[(game + turn) % len(options)]
+            result = take_speculation(runner, choice) or runner.run_graph_turn(choice)
+            assert result["response_count"] == turn
+            assert runner.current_turn()["response_count"] == turn
+
+
+def test_copy_from_a_missing_thread_is_a_miss():
+    graph = build_graph(CompactingMemorySaver())
+    assert copy_checkpoint(graph, "gone", "target") is None
+    assert graph.checkpointer.get_tuple({"configurable": {"thread_id": "target"}}) is None
@@ -0,0 +1,15 @@
+"""
+Startup budget: "import app" with the live providers selected stays under
+STARTUP_IMPORT_BUDGET_MS and leaves the provider SDKs to first use.
+"""
+import os
+
+from services.replay_bench import import_time
+
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+
+
+def test_app_imports_within_budget_without_provider_sdks():
+    report = import_time("app")
+    assert report["eager_modules"] == []
+    assert report["import_ms"] <= STARTUP_IMPORT_BUDGET_MS
@@ -1,36 +1,32 @@
-from utils.OpenAiJourneyUtils import OpenAiJourneyUtils
-from utils.HuggingFaceJourneysUtils import HuggingFaceJourneysUtils
+from utils.ImageProviderRegistry import get_image_providers
 class APIJourneyUtils:
     """
     Factory and orchestration utility for image generation backends used in the journey game.
-    It lazily initializes and caches image-generation clients per model, providing a unified
-    interface for generating images regardless of the underlying provider.
+    It resolves image-generation clients per model from the process-wide provider registry,
+    providing a unified interface for generating images regardless of the underlying provider.
     """
 
     def __init__(self):
         """
         Initializes the APIJourneyUtils with an empty connection registry.
-        Connections to image-generation providers are created on demand
-        and cached for reuse across requests.
+        Entries point at shared, pooled backends, so a per-game instance
+        holds no connections of its own.
         """
         self.ImageGen_connections = {}
+        self.providers = get_image_providers()
 
     def setup_ImageGen_connection(self, model_name):
         """
-        Creates and stores an image-generation client for the given model
-        if one does not already exist. Selects the appropriate backend
-        implementation based on the model name.
+        Looks up the shared image-generation client for the given model
+        if it is not already registered for this game. The provider
+        registry selects the backend implementation based on the model name.
         """
         if model_name not in self.ImageGen_connections:
-            if model_name == 'dall-e-3':
-                connection = OpenAiJourneyUtils()
-            elif model_name == 'black-forest-labs/FLUX.1-dev':
-                connection = HuggingFaceJourneysUtils(model_name)
-            self.ImageGen_connections[model_name] = connection
+            self.ImageGen_connections[model_name] = self.providers.get(model_name)
 
     def get_ImageGen_connection(self, model_name):
         """
-        Retrieves the cached image-generation client for the specified model.
+        Retrieves the image-generation client for the specified model.
         Assumes the connection has already been initialized via setup_ImageGen_connection.
         """
         return self.ImageGen_connections[model_name]
@@ -38,8 +34,16 @@ class APIJourneyUtils:
     def get_img(self, model_name, prompt):
         """
         Generates an image for the given prompt using the specified model.
-        Delegates image creation to the appropriate cached backend and
-        returns the resulting image URL or static path.
+        Delegates image creation to the shared backend (within its provider
+        concurrency limit) and returns the resulting image URL or static path.
         """
-        img_url = self.get_ImageGen_connection(model_name).get_img(model_name, prompt)
+        self.get_ImageGen_connection(model_name)
+        img_url = self.providers.get_img(model_name, prompt)
         return img_url
+
+    async def aget_img(self, model_name, prompt):
+        """
+        Async version of get_img that awaits the backend's async image call.
+        """
+        self.get_ImageGen_connection(model_name)
+        return await self.providers.aget_img(model_name, prompt)
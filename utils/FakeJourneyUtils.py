@@ -0,0 +1,50 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+from PIL import Image
+from utils.ImageCacheUtils import get_image_cache
+
+
+class FakeJourneyUtils:
+    """
+    Deterministic local image backend for load tests and replays. Paints a
+    flat image whose colour is derived from the prompt after a log-normally
+    distributed delay, and stores it in the shared image cache like the real backends.
+    """
+
+    IMAGE_SIZE = (1024, 1024)
+    LATENCY_MS = float(os.getenv("FAKE_IMAGE_LATENCY_MS", "2000"))
+    LATENCY_SIGMA = float(os.getenv("FAKE_IMAGE_LATENCY_SIGMA", "0.3"))
+
+    def __init__(self):
+        """
+        Attaches the shared image cache.
+        """
+        self.interactions_count = 0
+        self.cache = get_image_cache()
+
+    def _delay(self, key: str) -> float:
+        return random.Random(key).lognormvariate(0, self.LATENCY_SIGMA) * self.LATENCY_MS / 1000
+
+    def get_img(self, model_name: str, prompt: str) -> str:
+        """
+        Waits the simulated latency, paints the image and caches it (cache
+        hits are served by ImageProviderRegistry before the backend is called).
+        """
+        key = self.cache.key(model_name, prompt, self.IMAGE_SIZE)
+        time.sleep(self._delay(key))
+        return self._save_img(key)
+
+    async def aget_img(self, model_name: str, prompt: str) -> str:
+        """
+        Async version of get_img; the cache write runs in a worker thread.
+        """
+        key = self.cache.key(model_name, prompt, self.IMAGE_SIZE)
+        await asyncio.sleep(self._delay(key))
+        return await asyncio.to_thread(self._save_img, key)
+
+    def _save_img(self, key: str) -> str:
+        color = tuple(hashlib.sha256(key.encode("utf-8")).digest()[:3])
+        return self.cache.put(key, Image.new("RGB", self.IMAGE_SIZE, color))
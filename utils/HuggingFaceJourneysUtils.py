@@ -1,14 +1,15 @@
+import asyncio
 import os
-from huggingface_hub import InferenceClient
-from pathlib import Path
+from huggingface_hub import AsyncInferenceClient, InferenceClient
 from PIL import Image
+from utils.ImageCacheUtils import get_image_cache
 
 
 class HuggingFaceJourneysUtils:
     """
     Utility class for generating and saving images using supported Hugging Face text-to-image models.
     It manages model/provider validation, client initialization, interaction limits, and persistence
-    of generated images to a static output directory for downstream use (e.g., web apps).
+    of generated images to a shared content-addressed image cache for downstream use (e.g., web apps).
     """
     # Define supported models as class constant
     SUPPORTED_MODELS = {
@@ -16,17 +17,12 @@ class HuggingFaceJourneysUtils:
     }
     
     # Define constants
-    OUTPUT_DIR = Path("static/HuggingFaceImages/generated")
-    IMAGE_FILENAME = "hgfImage.png"
-    MAX_INTERACTIONS = 5
-    REFRESH_MESSAGE = (
-        "\n\n Storyteller, Please try to end the story NOW!"
-    )
+    IMAGE_SIZE = (1024, 1024)
     def __init__(self, model_name: str):
         """
-        Initializes the Hugging Face inference client for a supported text-to-image model.
-        Validates the model, configures the provider and authentication token, prepares the
-        output directory, and sets generation parameters such as temperature.
+        Initializes the sync and async Hugging Face inference clients for a supported text-to-image model.
+        Validates the model, configures the provider and authentication token, attaches the
+        shared image cache, and sets generation parameters such as temperature.
         """
         if model_name not in self.SUPPORTED_MODELS:
             raise ValueError(f"Unsupported model: {model_name}")
@@ -36,9 +32,12 @@ class HuggingFaceJourneysUtils:
             provider=self.provider,
             token=os.getenv("HF_TOKEN")  # Use token instead of api_key
         )
+        self.async_client = AsyncInferenceClient(
+            provider=self.provider,
+            token=os.getenv("HF_TOKEN")
+        )
         self.interactions_count = 0
-        self.output_dir = self.OUTPUT_DIR
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.cache = get_image_cache()
 
     def get_client(self) -> InferenceClient:
         """
@@ -50,22 +49,35 @@ class HuggingFaceJourneysUtils:
     
     def get_img(self, model_name: str, prompt: str) -> str:
         """
-        Generates an image from the given text prompt using the specified model
-        and saves it to the configured output directory. Returns the relative
-        static path to the saved image, or raises a RuntimeError on failure.
+        Generates the image with the specified model and stores it in the image
+        cache (cache hits are served by ImageProviderRegistry before the backend is called).
+        Returns the image URL, or raises a RuntimeError on failure.
+        """
+        key = self.cache.key(model_name, prompt, self.IMAGE_SIZE)
+        try:
+            width, height = self.IMAGE_SIZE
+            img = self.client.text_to_image(prompt=prompt, model=model_name, width=width, height=height)
+            return self._save_img(key, img)
+        except Exception as e:
+            raise RuntimeError(f"Image generation failed: {str(e)}") from e
+
+    async def aget_img(self, model_name: str, prompt: str) -> str:
+        """
+        Async version of get_img using the AsyncInferenceClient. The PIL save
+        runs in a worker thread so the event loop is never blocked on disk I/O.
         """
+        key = self.cache.key(model_name, prompt, self.IMAGE_SIZE)
         try:
-            img = self.client.text_to_image(prompt=prompt, model=model_name)
-            return self._save_img(img)
+            width, height = self.IMAGE_SIZE
+            img = await self.async_client.text_to_image(prompt=prompt, model=model_name, width=width, height=height)
+            return await asyncio.to_thread(self._save_img, key, img)
         except Exception as e:
-            raise RuntimeError(f"Image generation failed: {str(e)}")
+            raise RuntimeError(f"Image generation failed: {str(e)}") from e
 
-    def _save_img(self, img: Image.Image) -> str:
+    def _save_img(self, key: str, img: Image.Image) -> str:
         """
-        Saves the generated PIL image to the configured output directory
-        using a fixed filename. Returns the relative static path to the
-        saved image for use in web responses or templates.
+        Saves the generated PIL image into the content-addressed image cache
+        under its key. Returns the URL the image is served from for use in
+        web responses or templates.
         """
-        save_path = self.output_dir / self.IMAGE_FILENAME
-        img.save(save_path)
-        return f"/static/HuggingFaceImages/generated/{self.IMAGE_FILENAME}"
\ No newline at end of file
+        return self.cache.put(key, img)
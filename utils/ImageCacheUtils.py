@@ -0,0 +1,248 @@
+import hashlib
+import logging
+import mimetypes
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from threading import Lock, get_ident
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Not in every platform's mime database yet
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+
+logger = logging.getLogger(__name__)
+
+
+def transcode(source: str, targets: list[tuple[int, str]], image_format: str, quality: int) -> int:
+    """
+    Writes resized copies of an image, one per (width, path) target, and
+    returns the change in bytes stored. A variant that fails (e.g. a format
+    this Pillow build cannot write) is logged and skipped. Runs in the
+    transcode process pool.
+    """
+    from PIL import Image
+
+    written = 0
+    with Image.open(source) as img:
+        img.load()
+        for width, target in targets:
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            try:
+                height = round(img.height * width / img.width)
+                variant = img if width >= img.width else img.resize((width, height), Image.Resampling.LANCZOS)
+                variant.save(tmp_path, format=image_format, quality=quality)
+            except Exception:
+                logger.warning("skipping %s variant %s", image_format, target, exc_info=True)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                continue
+            written += os.path.getsize(tmp_path)
+            if os.path.exists(target):
+                written -= os.path.getsize(target)
+            os.replace(tmp_path, target)
+    return written
+
+
+class ImageCacheUtils:
+    """
+    Content-addressed on-disk store for generated images.
+    Images are keyed by a hash of (model, prompt, size), so repeated prompts are
+    served from disk without a provider call and concurrent games never
+    overwrite each other's files. The store is capped in bytes and evicts the
+    least recently used images first. Every stored image is also transcoded
+    (WebP by default) at several widths in a process pool, for srcset.
+    """
+
+    CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", "static/HuggingFaceImages/generated"))
+    MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    URL_PREFIX = "/images"
+    EXTENSION = ".png"
+    VARIANT_WIDTHS = tuple(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "256,512,1024").split(","))
+    VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "webp")
+    VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+    TRANSCODE_WORKERS = int(os.getenv("IMAGE_TRANSCODE_WORKERS", str(os.cpu_count() or 1)))
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        """
+        Prepares the cache directory and indexes the images already on disk.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.transcoded_bytes = 0
+        self.total_bytes = sum(p.stat().st_size for p in self.cache_dir.iterdir() if p.suffix != ".tmp")
+        self.transcoder = None
+        self.transcoding = {}
+
+    @staticmethod
+    def key(model_name: str, prompt: str, size) -> str:
+        """
+        Returns the content address for an image request.
+        """
+        return hashlib.sha256(f"{model_name}\0{size}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.EXTENSION}"
+
+    def _variant_name(self, key: str, width: int) -> str:
+        return f"{key}-{width}.{self.VARIANT_FORMAT}"
+
+    def url(self, key: str) -> str:
+        """
+        Returns the public URL the cached image is served from.
+        """
+        return f"{self.URL_PREFIX}/{key}{self.EXTENSION}"
+
+    def srcset(self, url: str) -> str | None:
+        """
+        Returns the srcset of the transcoded variants available for a cached
+        image URL, or None if the URL is not in the cache or has no variants
+        yet (variants that failed to transcode are left out).
+        """
+        if not url.startswith(f"{self.URL_PREFIX}/") or not url.endswith(self.EXTENSION):
+            return None
+        key = url[len(self.URL_PREFIX) + 1:-len(self.EXTENSION)]
+        names = [(w, self._variant_name(key, w)) for w in self.VARIANT_WIDTHS]
+        available = [(w, name) for w, name in names if (self.cache_dir / name).exists()]
+        if not available:
+            return None
+        return ", ".join(f"{self.URL_PREFIX}/{name} {w}w" for w, name in available)
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the URL of a cached image and marks it as recently used, or None on a miss.
+        """
+        try:
+            # Touch for LRU ordering (mtime is used because atime is often disabled)
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        if self.srcset(self.url(key)) is None:
+            # Cached before variants existed, or a transcode was lost:
+            # serve the PNG now and build the variants in the background
+            self._transcode(key)
+        return self.url(key)
+
+    def _get_transcoder(self) -> ProcessPoolExecutor:
+        """
+        Returns the transcode process pool, starting it on first use. Workers
+        are spawned rather than forked, since the parent runs many threads.
+        """
+        if self.transcoder is None:
+            with self.lock:
+                if self.transcoder is None:
+                    self.transcoder = ProcessPoolExecutor(
+                        max_workers=self.TRANSCODE_WORKERS,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self.transcoder
+
+    def _transcode(self, key: str) -> Future:
+        """
+        Submits a stored image to the process pool for transcoding into its
+        variants. Returns the future; the stored byte count is updated when it finishes.
+        """
+        transcoder = self._get_transcoder()
+        with self.lock:
+            # One transcode per key at a time
+            future = self.transcoding.get(key)
+            if future is not None:
+                return future
+            targets = [(w, str(self.cache_dir / self._variant_name(key, w))) for w in self.VARIANT_WIDTHS]
+            future = self.transcoding[key] = transcoder.submit(
+                transcode, str(self._path(key)), targets, self.VARIANT_FORMAT, self.VARIANT_QUALITY
+            )
+        future.add_done_callback(lambda f: self._transcoded(key, f))
+        return future
+
+    def _transcoded(self, key: str, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("transcoding image %s failed", key, exc_info=future.exception())
+        with self.lock:
+            self.transcoding.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.total_bytes += future.result()
+            self.transcoded_bytes += future.result()
+
+    def put(self, key: str, img: "Image.Image") -> str:
+        """
+        Stores an image under its key, evicting old images beyond the size cap,
+        and returns its URL at once; the variants are transcoded in the
+        background and join the srcset as they are written. Writes to a
+        temporary file first so readers never see a partial image.
+        """
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{get_ident()}.tmp")
+        img.save(tmp_path, format="PNG")
+        size = tmp_path.stat().st_size
+        with self.lock:
+            replaced = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self.total_bytes += size - replaced
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        self._transcode(key)
+        return self.url(key)
+
+    def _evict(self):
+        """
+        Deletes least recently used images, with their variants, until the
+        store is back under its cap.
+        """
+        files = sorted(self.cache_dir.glob(f"*{self.EXTENSION}"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            if self.total_bytes <= self.max_bytes:
+                break
+            variants = [self.cache_dir / self._variant_name(path.stem, w) for w in self.VARIANT_WIDTHS]
+            for file in [path, *variants]:
+                try:
+                    size = file.stat().st_size
+                    file.unlink()
+                except FileNotFoundError:
+                    continue
+                self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counters, the bytes currently stored and
+        the bytes written by transcoding.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self.total_bytes,
+                "transcoded_bytes": self.transcoded_bytes,
+            }
+
+
+_image_cache = None
+_image_cache_lock = Lock()
+
+
+def get_image_cache() -> ImageCacheUtils:
+    """
+    Returns the process-wide image cache, creating it on first use.
+    """
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCacheUtils()
+    return _image_cache
@@ -0,0 +1,160 @@
+import asyncio
+import os
+from threading import BoundedSemaphore, Lock
+
+from utils.ImageCacheUtils import get_image_cache
+from utils.Metrics import get_metrics
+from utils.ProviderGateway import ProviderGateway
+
+
+class ImageProviderRegistry:
+    """
+    Process-wide, thread-safe registry of image-generation backends.
+    Each backend is created once and shared by every game, so HTTP
+    connections are pooled and kept alive across players. Calls to a
+    provider are bounded by a per-provider semaphore; excess calls queue
+    until a slot frees up or IMAGE_QUEUE_TIMEOUT expires.
+    """
+
+    MAX_CONNECTIONS = int(os.getenv("IMAGE_POOL_MAX_CONNECTIONS", "20"))
+    MAX_KEEPALIVE = int(os.getenv("IMAGE_POOL_MAX_KEEPALIVE", "10"))
+    CONCURRENCY = int(os.getenv("IMAGE_PROVIDER_CONCURRENCY", "8"))
+    QUEUE_TIMEOUT = float(os.getenv("IMAGE_QUEUE_TIMEOUT", "60"))
+    # "live", or "fake" to serve every image model from the local fake backend
+    PROVIDER = os.getenv("IMAGE_PROVIDER", "live")
+
+    def __init__(self):
+        self.backends = {}
+        self.semaphores = {}
+        self.async_semaphores = {}
+        self.gateways = {}
+        self.lock = Lock()
+
+    def _create(self, model_name):
+        """
+        Builds the backend for a model with pooled HTTP clients. Provider SDKs
+        are imported here, on first use, to keep them off the startup path.
+        """
+        if self.PROVIDER == "fake":
+            from utils.FakeJourneyUtils import FakeJourneyUtils
+
+            return FakeJourneyUtils()
+        if model_name == 'dall-e-3':
+            import httpx
+            from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+            from utils.OpenAiJourneyUtils import OpenAiJourneyUtils
+
+            limits = httpx.Limits(max_connections=self.MAX_CONNECTIONS, max_keepalive_connections=self.MAX_KEEPALIVE)
+            return OpenAiJourneyUtils(
+                http_client=DefaultHttpxClient(limits=limits),
+                async_http_client=DefaultAsyncHttpxClient(limits=limits),
+            )
+        if model_name == 'black-forest-labs/FLUX.1-dev':
+            from utils.HuggingFaceJourneysUtils import HuggingFaceJourneysUtils
+
+            # huggingface_hub already shares one HTTP session per process for sync calls,
+            # and the shared AsyncInferenceClient keeps its own pooled session
+            return HuggingFaceJourneysUtils(model_name)
+        raise ValueError(f"Unsupported image model: {model_name}")
+
+    def get(self, model_name):
+        """
+        Returns the shared backend for a model, creating it on first use.
+        """
+        backend = self.backends.get(model_name)
+        if backend is None:
+            with self.lock:
+                backend = self.backends.get(model_name)
+                if backend is None:
+                    backend = self._create(model_name)
+                    self.semaphores[model_name] = BoundedSemaphore(self.CONCURRENCY)
+                    self.gateways[model_name] = ProviderGateway(model_name)
+                    # Published last, so the lock-free fast path never sees a half-built entry
+                    self.backends[model_name] = backend
+        return backend
+
+    def _cached(self, model_name, prompt):
+        """
+        Returns the cached image URL for the prompt at the backend's size, or
+        None. Checked before the gateway, so cache hits take no rate-limit
+        token or provider slot and never count towards the circuit breaker.
+        """
+        backend = self.get(model_name)
+        cache = get_image_cache()
+        return cache.get(cache.key(model_name, prompt, backend.IMAGE_SIZE))
+
+    def get_img(self, model_name, prompt):
+        """
+        Returns the cached image, or generates it through the provider gateway
+        and the shared backend. Identical concurrent prompts share one provider call.
+        """
+        if (cached_url := self._cached(model_name, prompt)) is not None:
+            return cached_url
+        return self.gateways[model_name].call((model_name, prompt), self._get_img, model_name, prompt)
+
+    def _get_img(self, model_name, prompt):
+        """
+        Calls the backend once a provider slot is free.
+        """
+        backend = self.backends[model_name]
+        semaphore = self.semaphores[model_name]
+        metrics = get_metrics()
+        with metrics.span("image.queue"):
+            acquired = semaphore.acquire(timeout=self.QUEUE_TIMEOUT)
+        if not acquired:
+            raise RuntimeError(f"Image generation failed: {model_name} is busy")
+        try:
+            with metrics.span("image.generate"):
+                return backend.get_img(model_name, prompt)
+        finally:
+            semaphore.release()
+
+    async def aget_img(self, model_name, prompt):
+        """
+        Async version of get_img.
+        """
+        if (cached_url := self._cached(model_name, prompt)) is not None:
+            return cached_url
+        return await self.gateways[model_name].acall((model_name, prompt), self._aget_img, model_name, prompt)
+
+    async def _aget_img(self, model_name, prompt):
+        """
+        Async version of _get_img. Async slots are separate from the sync ones
+        and are bound to the shared event loop that runs all async image calls.
+        """
+        backend = self.backends[model_name]
+        with self.lock:
+            semaphore = self.async_semaphores.setdefault(model_name, asyncio.Semaphore(self.CONCURRENCY))
+        metrics = get_metrics()
+        try:
+            with metrics.span("image.queue"):
+                await asyncio.wait_for(semaphore.acquire(), self.QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Image generation failed: {model_name} is busy")
+        try:
+            with metrics.span("image.generate"):
+                return await backend.aget_img(model_name, prompt)
+        finally:
+            semaphore.release()
+
+    def stats(self) -> dict:
+        """
+        Returns the gateway counters per image model.
+        """
+        return {model_name: gateway.stats() for model_name, gateway in list(self.gateways.items())}
+
+
+_image_providers = None
+_image_providers_lock = Lock()
+
+
+def get_image_providers() -> ImageProviderRegistry:
+    """
+    Returns the process-wide image provider registry, creating it on first use.
+    """
+    global _image_providers
+    if _image_providers is None:
+        with _image_providers_lock:
+            if _image_providers is None:
+                _image_providers = ImageProviderRegistry()
+    return _image_providers
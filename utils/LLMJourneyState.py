@@ -1,12 +1,16 @@
 class LLMJourneyState:
     """
-    Manages the state and associated messages of interactive buttons used in a GPT-powered journey.
+    Per-request view of the interactive buttons used in a GPT-powered journey.
+    The options themselves live in the game's checkpoint (GameState.options);
+    this object only maps them to buttons for one request and is never stored.
 
     Attributes:
-        button_messages (dict): Maps button names (e.g., "button1") to their associated message text.
+        button_messages (dict): Maps button names (e.g., "Option 1") to their associated message text.
         button_states (dict): Tracks whether each button has been pressed (True) or not (False).
     """
 
+    __slots__ = ("button_messages", "button_states")
+
     def __init__(self):
         self.button_messages = {}
         self.button_states = {}
@@ -1,20 +1,32 @@
-from openai import OpenAI
+import asyncio
+import base64
+import io
+
+from openai import AsyncOpenAI, OpenAI
 import os
 
+from utils.ImageCacheUtils import get_image_cache
+
 class OpenAiJourneyUtils:
     """
     Utility class for generating images using OpenAI image models within the journey game.
     It manages OpenAI client initialization, interaction tracking, and provides a simple
-    interface for creating images from text prompts.
+    interface for creating images from text prompts. Images are stored in the shared
+    image cache, like the Hugging Face backend's.
     """
 
-    def __init__(self):
+    IMAGE_SIZE = "1024x1024"
+
+    def __init__(self, http_client=None, async_http_client=None):
         """
-        Initializes the OpenAI client using the API key from environment variables
-        and resets the interaction counter for the current session.
+        Initializes the sync and async OpenAI clients using the API key from
+        environment variables and resets the interaction counter for the current session.
+        Optional httpx clients let callers supply pooled connections with their own limits.
         """
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), http_client=http_client)
+        self.async_client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), http_client=async_http_client)
         self.interactions_count = 0 
+        self.cache = get_image_cache()
 
     def get_client(self):
         """
@@ -26,17 +38,47 @@ class OpenAiJourneyUtils:
     
     def get_img(self, model_name: str, prompt: str) -> str:
         """
-        Generates an image from the given text prompt using the specified OpenAI model.
-        Returns the URL of the generated image, or raises a RuntimeError if
-        image generation fails.
+        Generates the image with the specified OpenAI model and stores it in the image
+        cache (cache hits are served by ImageProviderRegistry before the backend is called).
+        Returns the image URL, or raises a RuntimeError if image generation fails.
         """
+        key = self.cache.key(model_name, prompt, self.IMAGE_SIZE)
         try:
             image_response = self.client.images.generate(
                 model=model_name,
                 prompt=prompt,
                 n=1,
-                size="1024x1024"
+                size=self.IMAGE_SIZE,
+                response_format="b64_json"
+            )
+            return self._save_img(key, image_response.data[0].b64_json)
+        except Exception as e:
+            raise RuntimeError(f"Image generation failed: {str(e)}") from e
+
+    async def aget_img(self, model_name: str, prompt: str) -> str:
+        """
+        Async version of get_img using the AsyncOpenAI client, so the request
+        waits on the image call without holding a worker thread.
+        """
+        key = self.cache.key(model_name, prompt, self.IMAGE_SIZE)
+        try:
+            image_response = await self.async_client.images.generate(
+                model=model_name,
+                prompt=prompt,
+                n=1,
+                size=self.IMAGE_SIZE,
+                response_format="b64_json"
             )
-            return image_response.data[0].url
+            return await asyncio.to_thread(self._save_img, key, image_response.data[0].b64_json)
         except Exception as e:
-            raise RuntimeError(f"Image generation failed: {str(e)}")
+            raise RuntimeError(f"Image generation failed: {str(e)}") from e
+
+    def _save_img(self, key: str, b64_image: str) -> str:
+        """
+        Decodes a base64 image returned by the API and stores it in the image
+        cache under its key. Returns the URL the image is served from.
+        """
+        from PIL import Image
+
+        img = Image.open(io.BytesIO(base64.b64decode(b64_image)))
+        return self.cache.put(key, img)
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import Future
+from threading import Lock
+
+# Status codes worth retrying: timeouts, conflicts, throttling and transient server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class ProviderUnavailable(RuntimeError):
+    """
+    Raised without calling the provider while its circuit breaker is open.
+    """
+
+
+def _status_code(exc):
+    """
+    Returns the HTTP status carried by a provider exception (OpenAI, httpx or
+    Hugging Face style), or None.
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(exc) -> bool:
+    """
+    True for throttling, timeouts, connection errors and transient 5xx responses.
+    Follows wrapped causes, since backends re-raise provider errors as RuntimeError.
+    """
+    while exc is not None:
+        if isinstance(exc, ProviderUnavailable):
+            return False
+        if _status_code(exc) in RETRYABLE_STATUS:
+            return True
+        if isinstance(exc, (TimeoutError, ConnectionError)):
+            return True
+        name = type(exc).__name__
+        if "Timeout" in name or "Connection" in name:
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def _retry_after(exc):
+    """
+    Returns the provider's Retry-After hint in seconds, if any.
+    """
+    while exc is not None:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+        exc = exc.__cause__
+    return None
+
+
+class ProviderGateway:
+    """
+    Guards every call to one provider with a token-bucket rate limit, retries
+    with jittered exponential backoff, a circuit breaker and single-flight
+    coalescing of concurrent identical requests. Works for both blocking
+    calls (call) and coroutines (acall); both share one bucket and breaker.
+    """
+
+    RATE = float(os.getenv("PROVIDER_RATE_LIMIT", "5"))
+    BURST = int(os.getenv("PROVIDER_BURST", "10"))
+    MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "4"))
+    BACKOFF_BASE = float(os.getenv("PROVIDER_BACKOFF_BASE", "0.5"))
+    BACKOFF_MAX = float(os.getenv("PROVIDER_BACKOFF_MAX", "20"))
+    BREAKER_THRESHOLD = int(os.getenv("PROVIDER_BREAKER_THRESHOLD", "5"))
+    BREAKER_RESET = float(os.getenv("PROVIDER_BREAKER_RESET", "30"))
+
+    def __init__(self, name: str, rate: float = RATE, burst: int = BURST, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX,
+                 breaker_threshold: int = BREAKER_THRESHOLD, breaker_reset: float = BREAKER_RESET,
+                 clock=time.monotonic, rng=random.random):
+        """
+        Rates are in requests per second. clock and rng can be replaced to
+        drive the gateway deterministically.
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.clock = clock
+        self.rng = rng
+
+        self.lock = Lock()
+        self.tokens = float(burst)
+        self.refilled_at = clock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.inflight = {}
+        self.async_inflight = {}
+        self.counters = {"calls": 0, "retries": 0, "coalesced": 0, "rejected": 0, "failures": 0}
+
+    # --- token bucket ---------------------------------------------------
+
+    def _reserve(self) -> float:
+        """
+        Takes one token and returns how long the caller must wait for it.
+        Tokens may go negative, which queues callers in arrival order.
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    # --- circuit breaker ------------------------------------------------
+
+    def _admit(self):
+        """
+        Fails fast while the breaker is open; after BREAKER_RESET seconds a
+        single trial call is let through (half-open).
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.clock() - self.opened_at >= self.breaker_reset and not self.trial_running:
+                self.trial_running = True
+                return
+            self.counters["rejected"] += 1
+        raise ProviderUnavailable(f"{self.name} is unavailable (circuit open)")
+
+    def _record(self, ok: bool):
+        with self.lock:
+            self.trial_running = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            self.counters["failures"] += 1
+            if self.failures >= self.breaker_threshold:
+                self.opened_at = self.clock()
+
+    def _backoff(self, attempt: int, exc) -> float:
+        """
+        Full-jitter exponential backoff, never shorter than a Retry-After hint.
+        """
+        delay = self.rng() * min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        hint = _retry_after(exc)
+        return max(delay, min(hint, self.backoff_max)) if hint is not None else delay
+
+    # --- blocking calls -------------------------------------------------
+
+    def call(self, key, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) through the gateway. Concurrent calls with
+        the same non-None key share one provider call and its result.
+        """
+        if key is None:
+            return self._call(fn, *args, **kwargs)
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = self._call(fn, *args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _call(self, fn, *args, **kwargs):
+        with self.lock:
+            self.counters["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            time.sleep(self._reserve())
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                self._record(ok=not retryable)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    self.counters["retries"] += 1
+                time.sleep(self._backoff(attempt, e))
+            else:
+                self._record(ok=True)
+                return result
+
+    # --- coroutines -----------------------------------------------------
+
+    async def acall(self, key, fn, *args, **kwargs):
+        """
+        Async version of call: fn returns a coroutine and waits use asyncio.sleep.
+        """
+        if key is None:
+            return await self._acall(fn, *args, **kwargs)
+        with self.lock:
+            task = self.async_inflight.get(key)
+            if task is None:
+                task = self.async_inflight[key] = asyncio.ensure_future(self._acall(fn, *args, **kwargs))
+                task.add_done_callback(lambda _: self.async_inflight.pop(key, None))
+            else:
+                self.counters["coalesced"] += 1
+        # Shield the shared call so one cancelled waiter does not cancel the others
+        return await asyncio.shield(task)
+
+    async def _acall(self, fn, *args, **kwargs):
+        with self.lock:
+            self.counters["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            await asyncio.sleep(self._reserve())
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                self._record(ok=not retryable)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    self.counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+            else:
+                self._record(ok=True)
+                return result
+
+    def stats(self) -> dict:
+        """
+        Returns call/retry/coalesce/reject/failure counters and the breaker state.
+        """
+        with self.lock:
+            state = "closed" if self.opened_at is None else "open"
+            return {**self.counters, "breaker": state}
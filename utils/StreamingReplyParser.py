@@ -0,0 +1,107 @@
+import json
+import re
+
+from langchain_core.utils.json import parse_partial_json
+
+
+class StreamingReplyParser:
+    """
+    Incremental parser for story replies. Accepts either the structured JSON
+    reply ({"narrative": ..., "options": [...]}, possibly still partial) or
+    the plain-text format of narrative text followed by 'Option N:' lines.
+    Tokens can be fed as they stream in; the parser releases narrative text
+    as soon as it is known to be final, and each option once it is complete.
+    """
+
+    MARKER = "Option 1:"
+    OPTION_PATTERN = re.compile(r"Option \d:.*")
+    OPTION_PREFIX = re.compile(r"Option \d:\s*")
+    MAX_OPTIONS = 3
+
+    def __init__(self):
+        self.buffer = ""
+        self.json_mode = None
+        self.narrative = ""
+        self.narrative_sent = 0
+        self.narrative_complete = False
+        self.options = []
+        self.finished = False
+
+    def feed(self, token: str):
+        """
+        Adds a streamed token. Returns a tuple of (new narrative text, newly completed options).
+        """
+        self.buffer += token
+        return self._advance()
+
+    def finish(self):
+        """
+        Marks the reply as complete and flushes any remaining narrative and the last option line.
+        """
+        self.finished = True
+        return self._advance()
+
+    def _advance(self):
+        if self.json_mode is None and self.buffer.strip():
+            self.json_mode = self.buffer.lstrip().startswith("{")
+        narrative, options = self._parse_json() if self.json_mode else self._parse_text()
+
+        # Narrative text only ever grows; release the new part
+        delta = ""
+        if len(narrative) > self.narrative_sent and narrative.startswith(self.narrative[:self.narrative_sent]):
+            delta = narrative[self.narrative_sent:]
+            self.narrative_sent = len(narrative)
+        self.narrative = narrative
+
+        new_options = options[:self.MAX_OPTIONS][len(self.options):]
+        self.options.extend(new_options)
+        return delta, new_options
+
+    def _parse_text(self):
+        """
+        Returns (releasable narrative, complete options) for the 'Option N:' text format.
+        """
+        marker_at = self.buffer.find(self.MARKER)
+        if marker_at >= 0 or self.finished:
+            self.narrative_complete = True
+            narrative_end = marker_at if marker_at >= 0 else len(self.buffer)
+        else:
+            # Hold back a tail that could still turn into the option marker
+            narrative_end = max(self.narrative_sent, len(self.buffer) - len(self.MARKER) + 1)
+
+        options = []
+        if marker_at >= 0:
+            lines = self.buffer[marker_at:].split("\n")
+            if not self.finished:
+                # The last line may still be streaming
+                lines = lines[:-1]
+            options = [
+                self.OPTION_PREFIX.sub("", opt)
+                for line in lines
+                for opt in self.OPTION_PATTERN.findall(line)
+            ]
+        return self.buffer[:narrative_end], options
+
+    def _parse_json(self):
+        """
+        Returns (releasable narrative, complete options) for a structured JSON
+        reply. Partial JSON is completed with parse_partial_json; the last
+        option is only released once the JSON is complete.
+        """
+        try:
+            data, complete = json.loads(self.buffer), True
+        except ValueError:
+            # A trailing backslash is the start of an escape that has not streamed yet
+            stripped = self.buffer.rstrip("\\") if not self.finished else self.buffer
+            data, complete = parse_partial_json(stripped), self.finished
+        if not isinstance(data, dict):
+            self.narrative_complete = self.narrative_complete or self.finished
+            return self.narrative, self.options
+
+        narrative = data.get("narrative")
+        narrative = narrative if isinstance(narrative, str) else ""
+        self.narrative_complete = complete or "options" in data
+        options = [opt for opt in data.get("options") or [] if isinstance(opt, str)]
+        if not complete:
+            options = options[:-1]
+        return narrative, options